@@ -302,6 +302,14 @@ CELERY_WORKER_SEND_TASK_EVENTS = True
 CELERY_TASK_SEND_SENT_EVENT = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-hijack-root-logger
 CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-routes
+# Each platform publishes from its own queue, so it can be given its own
+# workers, pool type and concurrency (see compose/production)
+CELERY_TASK_ROUTES = {
+    "xedule.app.tasks.publish_notes_to_twitter": {"queue": "publish.twitter"},
+    "xedule.app.tasks.publish_notes_to_nostr": {"queue": "publish.nostr"},
+    "xedule.app.tasks.retry_relay_deliveries": {"queue": "publish.nostr"},
+}
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool("DJANGO_ACCOUNT_ALLOW_REGISTRATION", True)
@@ -328,3 +336,99 @@ COMPRESS_URL = STATIC_URL
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Nostr
+# ------------------------------------------------------------------------------
+# Relays every note is published to, on top of the user's own relays.
+NOSTR_DEFAULT_RELAYS = env.list(
+    "NOSTR_DEFAULT_RELAYS",
+    default=[
+        "wss://nostr-pub.wellorder.net",
+        "wss://relay.damus.io",
+        "wss://relay.snort.social",
+        "wss://relay.primal.net",
+    ],
+)
+# Seconds to wait for the relays' OK replies before giving up on them.
+NOSTR_PUBLISH_TIMEOUT = env.float("NOSTR_PUBLISH_TIMEOUT", default=5.0)
+# Seconds between websocket pings on the pooled relay connections.
+NOSTR_RELAY_KEEPALIVE = env.float("NOSTR_RELAY_KEEPALIVE", default=20.0)
+# Seconds after which an unused pooled relay connection is closed.
+NOSTR_RELAY_IDLE_TIMEOUT = env.float("NOSTR_RELAY_IDLE_TIMEOUT", default=600.0)
+# Consecutive failures after which a relay is skipped for NOSTR_RELAY_COOLDOWN seconds.
+NOSTR_RELAY_FAILURE_THRESHOLD = env.int("NOSTR_RELAY_FAILURE_THRESHOLD", default=5)
+NOSTR_RELAY_COOLDOWN = env.int("NOSTR_RELAY_COOLDOWN", default=300)
+# Users whose decoded keys are kept in memory by each worker process.
+NOSTR_KEY_CACHE_SIZE = env.int("NOSTR_KEY_CACHE_SIZE", default=1024)
+# Processes signing large batches of events (0 means one per CPU core) and the
+# smallest batch worth sending to them.
+NOSTR_SIGNING_PROCESSES = env.int("NOSTR_SIGNING_PROCESSES", default=0)
+NOSTR_SIGNING_BATCH_SIZE = env.int("NOSTR_SIGNING_BATCH_SIZE", default=64)
+
+# Publishing
+# ------------------------------------------------------------------------------
+# Maximum number of notes handled by a single publish_user_notes task.
+PUBLISH_BATCH_SIZE = env.int("PUBLISH_BATCH_SIZE", default=50)
+# Failed notes are retried on a later run, after
+# backoff_base * 2 ** (attempt - 1) seconds plus up to `jitter` random seconds,
+# and marked as errored once a failing platform reaches max_attempts.
+PUBLISH_RETRY_POLICY = {
+    "twitter": {
+        "max_attempts": env.int("TWITTER_MAX_ATTEMPTS", default=3),
+        "backoff_base": env.int("TWITTER_BACKOFF_BASE", default=60),
+        "jitter": env.int("TWITTER_BACKOFF_JITTER", default=30),
+    },
+    "nostr": {
+        "max_attempts": env.int("NOSTR_MAX_ATTEMPTS", default=5),
+        "backoff_base": env.int("NOSTR_BACKOFF_BASE", default=30),
+        "jitter": env.int("NOSTR_BACKOFF_JITTER", default=15),
+    },
+}
+# Seconds a worker keeps its claim on the notes it is publishing. Must be longer
+# than the task time limit so that only crashed workers lose their claims.
+PUBLISH_CLAIM_LEASE = CELERY_TASK_TIME_LIMIT + 60
+# Keep due notes in a Redis sorted set so the periodic task only reads Redis
+# when nothing is due. Rebuild it with `manage.py rebuild_due_index`.
+PUBLISH_DUE_INDEX = env.bool("PUBLISH_DUE_INDEX", default=True)
+# Maximum number of due notes taken from the index by a single periodic run.
+PUBLISH_DUE_INDEX_POP_SIZE = env.int("PUBLISH_DUE_INDEX_POP_SIZE", default=5000)
+# Minutes between the periodic runs that read the due notes from the database,
+# to publish the ones the index lost in a failed update or a Redis restart.
+PUBLISH_DUE_INDEX_SWEEP_INTERVAL = env.int(
+    "PUBLISH_DUE_INDEX_SWEEP_INTERVAL",
+    default=15,
+)
+# Notes scheduled within this many seconds are also queued with an ETA at their
+# exact time, instead of waiting for the next periodic run (0 disables it). Keep
+# it below the broker's visibility timeout, one hour with Redis, or the queued
+# tasks are delivered twice.
+PUBLISH_ETA_HORIZON = env.int("PUBLISH_ETA_HORIZON", default=45 * 60)
+# Lease in seconds of the lock that keeps publish runs from overlapping. It is
+# renewed while a run is active and expires this long after a worker crashes.
+PUBLISH_SWEEP_LOCK_TIMEOUT = env.int("PUBLISH_SWEEP_LOCK_TIMEOUT", default=60)
+# Due notes read per query by a publish run, and seconds after which the run
+# stops and queues a new run to continue, well within the soft time limit.
+PUBLISH_SWEEP_PAGE_SIZE = env.int("PUBLISH_SWEEP_PAGE_SIZE", default=1000)
+PUBLISH_SWEEP_TIME_BUDGET = CELERY_TASK_SOFT_TIME_LIMIT - 15
+# Publish attempts written to the database at once.
+PUBLISH_ATTEMPT_LOG_BATCH_SIZE = env.int("PUBLISH_ATTEMPT_LOG_BATCH_SIZE", default=500)
+# Days publish attempts are kept before the periodic task prunes them.
+PUBLISH_ATTEMPT_RETENTION = env.int("PUBLISH_ATTEMPT_RETENTION", default=14)
+# Bearer token Prometheus sends to scrape /metrics ("" disables the endpoint).
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+# Port on which each Celery worker serves its Prometheus metrics (0 disables it).
+# Prefork workers also need PROMETHEUS_MULTIPROC_DIR, shared by their processes.
+CELERY_METRICS_PORT = env.int("CELERY_METRICS_PORT", default=0)
+# Where spans of the publishing pipeline go: "file", "otlp" or "" (off). OTLP
+# is configured with the OTEL_EXPORTER_OTLP_* variables.
+TRACING_EXPORTER = env("TRACING_EXPORTER", default="")
+TRACING_FILE = env("TRACING_FILE", default=str(BASE_DIR / "traces.jsonl"))
+# Share of new traces kept. Publish spans follow the decision of the request
+# that created the note.
+TRACING_SAMPLE_RATE = env.float("TRACING_SAMPLE_RATE", default=0.05)
+
+# Twitter
+# ------------------------------------------------------------------------------
+# Twitter clients kept per worker process, one per user.
+TWITTER_CLIENT_CACHE_SIZE = env.int("TWITTER_CLIENT_CACHE_SIZE", default=1024)
+# Keep-alive connections to api.twitter.com kept per worker process.
+TWITTER_HTTP_POOL_SIZE = env.int("TWITTER_HTTP_POOL_SIZE", default=10)
@@ -36,3 +36,7 @@ TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore[index]
 MEDIA_URL = "http://media.testserver/"
 # Your stuff...
 # ------------------------------------------------------------------------------
+# There is no Redis server in the test environment
+PUBLISH_DUE_INDEX = False
+# Chords keep their results in memory
+CELERY_RESULT_BACKEND = "cache+memory://"
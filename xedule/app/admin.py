@@ -1,27 +1,207 @@
 # tweets/admin.py
+from datetime import UTC
+from datetime import datetime
+
 from django.contrib import admin
+from django.db.models import F
 
+from .due_index import reindex_notes
 from .models import Note
+from .models import NoteDelivery
+from .models import PublishAttempt
+from .models import PublishIntent
+from .models import RelayStats
 from .models import TwitterCredentials
+from .tasks import replay_dead_letters
+from .tasks import resolve_publish_intents
+from .twitter import get_twitter_quota
+
+
+class NoteDeliveryInline(admin.TabularInline):
+    model = NoteDelivery
+    extra = 0
+    can_delete = False
+    fields = (
+        "platform",
+        "target",
+        "status",
+        "attempts",
+        "latency",
+        "next_attempt_at",
+        "last_error",
+    )
+    readonly_fields = fields
 
 
 @admin.register(Note)
 class TweetAdmin(admin.ModelAdmin):
     list_display = ("content", "status", "scheduled_time", "created_at", "published_at")
-    list_filter = ("status", "created_at", "published_at")
+    list_filter = ("status", "error_kind", "created_at", "published_at")
     search_fields = ("content",)
-    readonly_fields = ("published_at", "tweet_id")
-    actions = ["mark_as_pending"]
+    readonly_fields = ("published_at", "tweet_id", "error_kind")
+    actions = ["mark_as_pending", "replay"]
+    inlines = [NoteDeliveryInline]
 
     @admin.action(
         description="Marcar tweets seleccionados como pendientes",
     )
     def mark_as_pending(self, request, queryset):
-        queryset.update(status="pending", published_at=None, tweet_id=None)
+        queryset.update(
+            status="pending",
+            published_at=None,
+            tweet_id="",
+            attempts=0,
+            next_attempt_at=None,
+            version=F("version") + 1,
+        )
+        # Tweet again instead of picking up the previous tweet's ID
+        PublishIntent.objects.filter(note__in=queryset, platform="twitter").delete()
+        reindex_notes(list(queryset.values_list("id", flat=True)))
+
+    @admin.action(
+        description="Replay the selected failed notes",
+    )
+    def replay(self, request, queryset):
+        replayed = replay_dead_letters(queryset)
+        self.message_user(request, f"{replayed} notes sent back to be published.")
+
+
+@admin.register(PublishIntent)
+class PublishIntentAdmin(admin.ModelAdmin):
+    list_display = ("note", "platform", "state", "platform_id", "created_at")
+    list_filter = ("state", "platform", "created_at")
+    search_fields = ("platform_id", "note__content")
+    readonly_fields = ("note", "platform", "state", "claimed_by", "created_at")
+    actions = ["resolve_as_posted", "resolve_as_not_posted"]
+
+    @admin.action(
+        description="The post exists: use the Platform ID and replay the notes",
+    )
+    def resolve_as_posted(self, request, queryset):
+        resolved = resolve_publish_intents(queryset, posted=True)
+        self.message_user(request, f"{resolved} intents resolved as posted.")
+
+    @admin.action(
+        description="Nothing was posted: post the notes again",
+    )
+    def resolve_as_not_posted(self, request, queryset):
+        resolved = resolve_publish_intents(queryset, posted=False)
+        self.message_user(request, f"{resolved} intents resolved as not posted.")
+
+
+@admin.register(PublishAttempt)
+class PublishAttemptAdmin(admin.ModelAdmin):
+    list_display = (
+        "note",
+        "platform",
+        "outcome",
+        "error_kind",
+        "http_status",
+        "queue_ms",
+        "send_ms",
+        "relays",
+        "created_at",
+    )
+    list_filter = ("platform", "outcome", "error_kind", "created_at")
+    search_fields = ("error_class",)
+    list_select_related = ("note",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Queued (ms)")
+    def queue_ms(self, obj):
+        return _milliseconds(obj.queued_at, obj.claimed_at)
+
+    @admin.display(description="Sent to acked (ms)")
+    def send_ms(self, obj):
+        return _milliseconds(obj.sent_at, obj.acked_at)
+
+    @admin.display(description="Relays")
+    def relays(self, obj):
+        if obj.relay_count is None:
+            return "-"
+        return f"{obj.relays_accepted or 0} / {obj.relay_count}"
+
+
+def _milliseconds(start, end):
+    if start is None or end is None:
+        return "-"
+    return round((end - start).total_seconds() * 1000)
 
 
 @admin.register(TwitterCredentials)
 class TwitterCredentialsAdmin(admin.ModelAdmin):
-    list_display = ("user", "created_at", "updated_at")
+    list_display = (
+        "user",
+        "remaining_quota",
+        "quota_reset",
+        "created_at",
+        "updated_at",
+    )
     search_fields = ("user__username",)
     readonly_fields = ("created_at", "updated_at")
+
+    @admin.display(description="Remaining quota")
+    def remaining_quota(self, obj):
+        quota = get_twitter_quota(obj.user_id)
+        if quota is None:
+            return "-"
+        return f"{quota['remaining']} / {quota['limit']}"
+
+    @admin.display(description="Quota resets at")
+    def quota_reset(self, obj):
+        quota = get_twitter_quota(obj.user_id)
+        if quota is None or not quota["reset"]:
+            return "-"
+        return datetime.fromtimestamp(quota["reset"], tz=UTC)
+
+
+@admin.register(RelayStats)
+class RelayStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "url",
+        "publishes",
+        "failure_percentage",
+        "avg_connect_ms",
+        "avg_ack_ms",
+        "total_time",
+        "consecutive_failures",
+        "circuit_open_until",
+    )
+    list_filter = ("circuit_open_until",)
+    search_fields = ("url",)
+    ordering = ("-total_time",)
+    readonly_fields = (
+        "publishes",
+        "failures",
+        "consecutive_failures",
+        "total_connect_time",
+        "total_ack_time",
+        "total_time",
+        "last_error",
+        "last_failure_at",
+        "updated_at",
+    )
+    actions = ["close_circuit"]
+
+    @admin.display(description="Failure rate")
+    def failure_percentage(self, obj):
+        return f"{obj.failure_rate:.1%}"
+
+    @admin.display(description="Avg connect (ms)")
+    def avg_connect_ms(self, obj):
+        return round(obj.avg_connect_time * 1000)
+
+    @admin.display(description="Avg ack (ms)")
+    def avg_ack_ms(self, obj):
+        return round(obj.avg_ack_time * 1000)
+
+    @admin.action(
+        description="Reset the circuit breaker of the selected relays",
+    )
+    def close_circuit(self, request, queryset):
+        queryset.update(circuit_open_until=None, consecutive_failures=0)
@@ -1,5 +1,7 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_migrate
+from django.db.models.signals import post_save
 
 
 class AppConfig(AppConfig):
@@ -8,7 +10,31 @@ class AppConfig(AppConfig):
 
     def ready(self):
         # Importar la función para crear tareas periódicas
+        from .models import NostrCredentials
+        from .models import Note
+        from .models import TwitterCredentials
         from .signals import create_periodic_tasks
+        from .signals import evict_nostr_keys
+        from .signals import evict_twitter_client
+        from .signals import queue_note_publish
+        from .signals import remove_from_due_index
+        from .signals import update_due_index
 
         # Conectar la señal post_migrate
         post_migrate.connect(create_periodic_tasks, sender=self)
+
+        # Invalidar el cliente de Twitter en caché al cambiar las credenciales
+        post_save.connect(evict_twitter_client, sender=TwitterCredentials)
+        post_delete.connect(evict_twitter_client, sender=TwitterCredentials)
+
+        # Invalidar las claves de Nostr en caché al cambiar las credenciales
+        post_save.connect(evict_nostr_keys, sender=NostrCredentials)
+        post_delete.connect(evict_nostr_keys, sender=NostrCredentials)
+
+        # Mantener el índice de notas pendientes de Redis al día
+        post_save.connect(update_due_index, sender=Note)
+        post_delete.connect(remove_from_due_index, sender=Note)
+
+        # Publicar ya las notas sin hora o vencidas, y a su hora exacta
+        # las programadas para pronto
+        post_save.connect(queue_note_publish, sender=Note)
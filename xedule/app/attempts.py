@@ -0,0 +1,54 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import PublishAttempt
+from .processes import per_process
+
+logger = logging.getLogger(__name__)
+
+
+class PublishAttemptLog:
+    """
+    Buffer of publish attempts, per process.
+
+    Attempts are kept in memory and written with a single INSERT by flush(),
+    which platform tasks call once they are done, or as soon as `batch_size`
+    attempts are waiting. The log is for diagnosis only: a failed write is
+    logged and the attempts dropped, never raised into the publish.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._attempts = []
+
+    def add(self, attempt):
+        with self._lock:
+            self._attempts.append(attempt)
+            full = len(self._attempts) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write the waiting attempts."""
+        with self._lock:
+            attempts, self._attempts = self._attempts, []
+        if not attempts:
+            return
+        try:
+            PublishAttempt.objects.bulk_create(attempts, batch_size=self.batch_size)
+        except DatabaseError:
+            logger.warning(
+                "Could not write %s publish attempts",
+                len(attempts),
+                exc_info=True,
+            )
+
+
+@per_process
+def get_publish_attempt_log():
+    """Return the publish attempt log of the current process."""
+    return PublishAttemptLog(batch_size=settings.PUBLISH_ATTEMPT_LOG_BATCH_SIZE)
@@ -0,0 +1,41 @@
+import threading
+from collections import OrderedDict
+
+
+class CredentialsCache:
+    """
+    Least recently used cache of what `build` makes from a user's credentials.
+
+    Each entry remembers the `updated_at` of the credentials it was built
+    from, so updated credentials get a new entry even when the update
+    happened in another process.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, credentials):
+        raise NotImplementedError
+
+    def get(self, credentials):
+        key = (credentials.user_id, credentials.updated_at)
+        with self._lock:
+            cached_key, value = self._entries.get(credentials.user_id, (None, None))
+            if cached_key == key:
+                self._entries.move_to_end(credentials.user_id)
+                return value
+
+        value = self.build(credentials)
+
+        with self._lock:
+            self._entries[credentials.user_id] = (key, value)
+            self._entries.move_to_end(credentials.user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
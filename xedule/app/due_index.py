@@ -0,0 +1,161 @@
+import functools
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from .models import DUE_STATUSES
+from .models import Note
+from .processes import per_process
+
+logger = logging.getLogger(__name__)
+
+DUE_INDEX_KEY = "xedule:due-notes"
+REBUILD_CHUNK_SIZE = 2000
+
+# Take the notes due at ARGV[1] (at most ARGV[3]) and push them back to
+# ARGV[2], the end of their lease, in one step. If the publish never happens
+# the notes come due again once the lease is over.
+_POP_DUE = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[2], id)
+end
+return ids
+"""
+
+
+@per_process
+def get_redis():
+    """Return the Redis client of the current process."""
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=5,
+        socket_connect_timeout=5,
+    )
+
+
+def _due_score(note):
+    """Epoch time at which `note` is due, or None if it has nothing to publish."""
+    due_at = note.due_at
+    return due_at.timestamp() if due_at else None
+
+
+def index_notes(notes):
+    """
+    Add `notes` to the due index, or drop them when they are no longer due.
+
+    The index is only a hint for the periodic task: the database stays the
+    source of truth, so a failed update is logged instead of raised. The
+    notes it misses are published by the periodic database sweep.
+    """
+    if not settings.PUBLISH_DUE_INDEX:
+        return
+    pipeline = get_redis().pipeline(transaction=False)
+    for note in notes:
+        score = _due_score(note)
+        if score is None:
+            pipeline.zrem(DUE_INDEX_KEY, note.id)
+        else:
+            pipeline.zadd(DUE_INDEX_KEY, {note.id: score})
+    try:
+        pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not update the due index", exc_info=True)
+
+
+def index_notes_on_commit(notes):
+    """Index `notes` once the current transaction commits."""
+    if settings.PUBLISH_DUE_INDEX:
+        transaction.on_commit(functools.partial(index_notes, list(notes)))
+
+
+def unindex_notes(note_ids):
+    """Drop the given notes from the due index."""
+    if not settings.PUBLISH_DUE_INDEX or not note_ids:
+        return
+    try:
+        get_redis().zrem(DUE_INDEX_KEY, *note_ids)
+    except redis.RedisError:
+        logger.warning("Could not update the due index", exc_info=True)
+
+
+def reindex_notes(note_ids):
+    """Index the given notes again from their current state in the database."""
+    if not settings.PUBLISH_DUE_INDEX or not note_ids:
+        return
+    notes = list(
+        Note.objects.filter(id__in=note_ids)
+        .only("status", "scheduled_time", "created_at", "next_attempt_at")
+        .order_by(),
+    )
+    index_notes(notes)
+    unindex_notes(list(set(note_ids) - {note.id for note in notes}))
+
+
+def pop_due_note_ids():
+    """
+    Return the ids of the notes due now, at most PUBLISH_DUE_INDEX_POP_SIZE.
+
+    The notes stay in the index, leased for PUBLISH_CLAIM_LEASE seconds, so
+    a lost publish is retried. Publishing a note re-indexes it. When nothing
+    is due this costs a single ZRANGEBYSCORE.
+    """
+    now = time.time()
+    note_ids = get_redis().eval(
+        _POP_DUE,
+        1,
+        DUE_INDEX_KEY,
+        now,
+        now + settings.PUBLISH_CLAIM_LEASE,
+        settings.PUBLISH_DUE_INDEX_POP_SIZE,
+    )
+    return [int(note_id) for note_id in note_ids]
+
+
+def due_backlog():
+    """
+    Return the number of notes due now and the epoch time the oldest came due.
+
+    Read from the index with one round trip. Notes leased by a publish run
+    are counted again once their lease is over.
+    """
+    now = time.time()
+    pipeline = get_redis().pipeline(transaction=False)
+    pipeline.zcount(DUE_INDEX_KEY, "-inf", now)
+    pipeline.zrange(DUE_INDEX_KEY, 0, 0, withscores=True)
+    size, oldest = pipeline.execute()
+    return size, oldest[0][1] if size else None
+
+
+def rebuild_due_index():
+    """
+    Rebuild the due index from the database and return its size.
+
+    The new index is written under a temporary key and renamed over the old
+    one, so the periodic task never sees a half built index.
+    """
+    client = get_redis()
+    building_key = f"{DUE_INDEX_KEY}:rebuild"
+    client.delete(building_key)
+
+    notes = (
+        Note.objects.filter(status__in=DUE_STATUSES)
+        .only("status", "scheduled_time", "created_at", "next_attempt_at")
+        .order_by()
+    )
+    size = 0
+    pipeline = client.pipeline(transaction=False)
+    for size, note in enumerate(notes.iterator(chunk_size=REBUILD_CHUNK_SIZE), 1):
+        pipeline.zadd(building_key, {note.id: _due_score(note)})
+        if size % REBUILD_CHUNK_SIZE == 0:
+            pipeline.execute()
+    pipeline.execute()
+
+    if size:
+        client.rename(building_key, DUE_INDEX_KEY)
+    else:
+        client.delete(DUE_INDEX_KEY)
+    return size
@@ -3,6 +3,8 @@ from django import forms
 from .models import NostrCredentials
 from .models import Note
 from .models import TwitterCredentials
+from .signing import decode_private_key
+from .signing import decode_public_key
 
 
 class TweetForm(forms.ModelForm):
@@ -66,3 +68,39 @@ class NostrCredentialsForm(forms.ModelForm):
             "public_key": "Your Nostr public key in npub format",
             "relay_urls": "Enter one relay URL per line, starting with wss://",
         }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The public key can always be derived from the private key
+        self.fields["public_key"].required = False
+
+    def clean_private_key(self):
+        try:
+            private_key = decode_private_key(self.cleaned_data["private_key"])
+        except ValueError:
+            msg = "Enter a valid Nostr private key (nsec or hex format)."
+            raise forms.ValidationError(msg) from None
+        # Store the keys in their canonical bech32 form
+        return private_key.bech32()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data is None or "private_key" not in cleaned_data:
+            return cleaned_data
+
+        public_key = decode_private_key(cleaned_data["private_key"]).public_key
+        if cleaned_data.get("public_key"):
+            try:
+                given_key = decode_public_key(cleaned_data["public_key"])
+            except ValueError:
+                self.add_error(
+                    "public_key", "Enter a valid Nostr public key (npub or hex format)."
+                )
+                return cleaned_data
+            if given_key.raw_bytes != public_key.raw_bytes:
+                self.add_error(
+                    "public_key", "This public key does not match the private key."
+                )
+                return cleaned_data
+        cleaned_data["public_key"] = public_key.bech32()
+        return cleaned_data
@@ -0,0 +1,71 @@
+import logging
+import threading
+
+import redis
+from redis.lock import Lock
+
+from .due_index import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLock:
+    """
+    Lock shared by every worker through Redis.
+
+    The lock is a lease of `timeout` seconds, renewed by a background thread
+    every `timeout / 3` seconds for as long as it is held. If the holder
+    crashes, renewal stops and the lock expires, so it is never held forever.
+
+    Renewal and release check the owner and act in one Lua script (see
+    redis.lock.Lock), so a holder whose lease ran out can neither renew nor
+    delete the lock of whoever took it next.
+    """
+
+    def __init__(self, name, timeout):
+        self.timeout = timeout
+        # The token must be visible to the renewing thread too
+        self._lock = Lock(
+            get_redis(),
+            f"lock:{name}",
+            timeout=timeout,
+            thread_local=False,
+        )
+        self._released = threading.Event()
+        self._renewer = None
+
+    def acquire(self):
+        """Take the lock without waiting. Returns whether it was taken."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self._released.clear()
+        self._renewer = threading.Thread(
+            target=self._renew,
+            name=f"renew-{self._lock.name}",
+            daemon=True,
+        )
+        self._renewer.start()
+        return True
+
+    def _renew(self):
+        while not self._released.wait(self.timeout / 3):
+            try:
+                self._lock.reacquire()
+            except redis.RedisError:
+                logger.warning("Lock %s expired while held", self._lock.name)
+                return
+
+    def release(self):
+        """Give up the lock, unless it already expired."""
+        self._released.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        try:
+            self._lock.release()
+        except redis.exceptions.LockError:
+            logger.warning("Lock %s expired while held", self._lock.name)
+
+    def locked(self):
+        """Whether anyone holds the lock."""
+        return self._lock.locked()
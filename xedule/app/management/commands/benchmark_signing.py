@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import nostr.key as nk
+from django.core.management.base import BaseCommand
+from nostr.event import Event
+
+from xedule.app.signing import sign_event_ids
+from xedule.app.signing import sign_events
+
+
+class Command(BaseCommand):
+    help = "Measure Nostr events signed per second for growing process counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=5000,
+            help="Events signed in each run",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            nargs="+",
+            help="Process counts to measure (default: 1, 2, 4... up to the cores)",
+        )
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        process_counts = options["processes"] or [
+            2**i for i in range(cores.bit_length()) if 2**i <= cores
+        ]
+        private_key = nk.PrivateKey()
+        public_key = private_key.public_key.hex()
+        events = [
+            Event(content=f"Benchmark note {i}", public_key=public_key)
+            for i in range(options["events"])
+        ]
+
+        self.stdout.write(f"{len(events)} events, {cores} cores")
+        self.stdout.write(f"{'processes':>9}  {'events/s':>10}  {'speedup':>7}")
+        baseline = None
+        for processes in process_counts:
+            rate = self._measure(private_key, events, processes)
+            baseline = baseline or rate
+            self.stdout.write(
+                f"{processes:>9}  {rate:>10.0f}  {rate / baseline:>6.2f}x",
+            )
+
+    def _measure(self, private_key, events, processes):
+        if processes == 1:
+            start = time.perf_counter()
+            sign_event_ids(private_key.raw_secret, [event.id for event in events])
+            return len(events) / (time.perf_counter() - start)
+
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            # Start the processes before timing, as a long lived pool would be
+            sign_events(private_key, events[: processes * 2], executor)
+            start = time.perf_counter()
+            sign_events(private_key, events, executor)
+            return len(events) / (time.perf_counter() - start)
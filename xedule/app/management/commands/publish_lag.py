@@ -0,0 +1,52 @@
+import math
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from xedule.app.models import Note
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the sorted `values`."""
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = "Report how long after their scheduled time notes were published"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Only notes published in the last HOURS hours",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options["hours"])
+        published = (
+            Note.objects.filter(
+                status="published",
+                published_at__gte=since,
+                scheduled_time__isnull=False,
+            )
+            .annotate(lag=F("published_at") - F("scheduled_time"))
+            .values_list("lag", flat=True)
+            .order_by()
+        )
+        lags = sorted(lag.total_seconds() for lag in published.iterator())
+        if not lags:
+            self.stdout.write(f"No notes published in the last {options['hours']} h")
+            return
+
+        self.stdout.write(
+            f"{len(lags)} notes published in the last {options['hours']} h",
+        )
+        for percent in PERCENTILES:
+            self.stdout.write(f"p{percent} lag: {percentile(lags, percent):.1f} s")
+        self.stdout.write(f"max lag: {lags[-1]:.1f} s")
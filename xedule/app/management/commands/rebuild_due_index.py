@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from xedule.app.due_index import rebuild_due_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis index of due notes from the database"
+
+    def handle(self, *args, **options):
+        size = rebuild_due_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {size} notes"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from xedule.app.models import Note
+from xedule.app.tasks import replay_dead_letters
+
+
+class Command(BaseCommand):
+    help = "Send dead-lettered notes back to be published"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Only the notes of the user with this username",
+        )
+        parser.add_argument(
+            "--kind",
+            choices=[kind for kind, _ in Note.ERROR_KIND_CHOICES],
+            help="Only the notes that failed with this kind of error",
+        )
+
+    def handle(self, *args, **options):
+        notes = Note.objects.filter(status="dead_letter")
+        if options["user"]:
+            notes = notes.filter(user__username=options["user"])
+        if options["kind"]:
+            notes = notes.filter(error_kind=options["kind"])
+        replayed = replay_dead_letters(notes)
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} notes"))
@@ -0,0 +1,136 @@
+import os
+import time
+
+from django.core.cache import cache
+from prometheus_client import REGISTRY
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.core import GaugeMetricFamily
+
+# Number of publish runs skipped because the previous one was still active
+SKIPPED_SWEEPS_KEY = "publish-sweep:skipped"
+# Size of the due backlog and due time of its oldest note, as last seen by
+# the periodic task
+DUE_BACKLOG_KEY = "metrics:due-backlog"
+# Seconds after which a backlog not refreshed by the periodic task is stale
+DUE_BACKLOG_TIMEOUT = 300
+
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600)
+CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PUBLISH_LAG = Histogram(
+    "xedule_publish_lag_seconds",
+    "Time from the scheduled time of a note to its publishing, per platform",
+    ["platform"],
+    buckets=LAG_BUCKETS,
+)
+TWITTER_CALL_SECONDS = Histogram(
+    "xedule_twitter_call_seconds",
+    "Duration of the Twitter create tweet calls",
+    buckets=CALL_BUCKETS,
+)
+RELAY_ACK_SECONDS = Histogram(
+    "xedule_relay_ack_seconds",
+    "Time relays took to accept or reject an event",
+    buckets=CALL_BUCKETS,
+)
+RELAY_PUBLISHES = Counter(
+    "xedule_relay_publishes",
+    "Events sent to relays, by whether the relay accepted them",
+    ["result"],
+)
+PUBLISH_RETRIES = Counter(
+    "xedule_publish_retries",
+    "Notes deferred for another attempt, per failing platform",
+    ["platform"],
+)
+DEAD_LETTERS = Counter(
+    "xedule_dead_letters",
+    "Notes moved to the dead letters, by kind of error",
+    ["kind"],
+)
+SWEEP_SECONDS = Histogram(
+    "xedule_publish_sweep_seconds",
+    "Duration of the publish_tweet runs",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+
+def observe_publish_lag(note, platform):
+    """Record how late `note` was published on `platform`."""
+    due_at = note.scheduled_time or note.created_at
+    if due_at is not None:
+        lag = time.time() - due_at.timestamp()
+        PUBLISH_LAG.labels(platform).observe(max(lag, 0))
+
+
+def observe_relay_results(relay_results):
+    """Record the answers of the relays an event was sent to."""
+    for result in relay_results.values():
+        RELAY_PUBLISHES.labels("accepted" if result["accepted"] else "rejected").inc()
+        if result.get("ack_time") is not None:
+            RELAY_ACK_SECONDS.observe(result["ack_time"])
+
+
+def record_due_backlog(size, oldest_due_at):
+    """
+    Store the size of the due backlog and the epoch time its oldest note
+    came due, for the /metrics endpoint to read without querying anything.
+    """
+    cache.set(
+        DUE_BACKLOG_KEY,
+        {"size": size, "oldest_due_at": oldest_due_at},
+        timeout=DUE_BACKLOG_TIMEOUT,
+    )
+
+
+class PipelineCollector:
+    """
+    Gauges of the whole publishing pipeline, read from the cache.
+
+    The values are written by the periodic task, so a scrape costs a single
+    cache read and no database query, whatever the number of scrapers.
+    """
+
+    def collect(self):
+        values = cache.get_many([DUE_BACKLOG_KEY, SKIPPED_SWEEPS_KEY])
+        backlog = values.get(DUE_BACKLOG_KEY)
+        if backlog is not None:
+            yield GaugeMetricFamily(
+                "xedule_due_backlog",
+                "Notes due for publishing",
+                value=backlog["size"],
+            )
+            oldest_due_at = backlog["oldest_due_at"]
+            yield GaugeMetricFamily(
+                "xedule_oldest_due_note_age_seconds",
+                "Time since the oldest due note came due",
+                value=max(time.time() - oldest_due_at, 0) if oldest_due_at else 0,
+            )
+        yield CounterMetricFamily(
+            "xedule_publish_sweeps_skipped",
+            "Publish runs skipped because the previous one was still active",
+            value=values.get(SKIPPED_SWEEPS_KEY, 0),
+        )
+
+
+def worker_registry():
+    """
+    The registry with the metrics of the current process.
+
+    With PROMETHEUS_MULTIPROC_DIR set, as needed by the prefork pool, the
+    metrics of every process writing to that directory are collected.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+# Served by the /metrics endpoint of the web app
+PIPELINE_REGISTRY = CollectorRegistry()
+PIPELINE_REGISTRY.register(PipelineCollector())
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_alter_nostrcredentials_relay_urls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=255, unique=True, verbose_name='Relay URL')),
+                ('publishes', models.PositiveIntegerField(default=0, verbose_name='Publishes')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='Failures')),
+                ('consecutive_failures', models.PositiveIntegerField(default=0, verbose_name='Consecutive failures')),
+                ('total_connect_time', models.FloatField(default=0, verbose_name='Total connect time (s)')),
+                ('total_ack_time', models.FloatField(default=0, verbose_name='Total ack time (s)')),
+                ('total_time', models.FloatField(default=0, help_text='Wall time spent waiting on this relay, timeouts included', verbose_name='Total time spent (s)')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('last_failure_at', models.DateTimeField(blank=True, null=True, verbose_name='Last failure')),
+                ('circuit_open_until', models.DateTimeField(blank=True, help_text='The relay is not published to until this time', null=True, verbose_name='Skipped until')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Relay stats',
+                'verbose_name_plural': 'Relay stats',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_note_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Claimed by'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Claimed until'),
+        ),
+    ]
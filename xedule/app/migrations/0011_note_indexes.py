@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:57
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking writes on a large note table
+    atomic = False
+
+    dependencies = [
+        ('app', '0010_note_version'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='note',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'published_x', 'published_n'))), fields=['scheduled_time', 'user'], name='note_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='note',
+            index=models.Index(fields=['user', 'created_at'], name='note_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:50
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking writes on a large note table
+    atomic = False
+
+    dependencies = [
+        ('app', '0011_note_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='note',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'published_x', 'published_n'))), fields=['user', 'scheduled_time', 'id'], name='note_sweep_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+def errors_to_dead_letters(apps, schema_editor):
+    Note = apps.get_model("app", "Note")
+    Note.objects.filter(status="error").update(status="dead_letter")
+
+
+def dead_letters_to_errors(apps, schema_editor):
+    Note = apps.get_model("app", "Note")
+    Note.objects.filter(status="dead_letter").update(status="error")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_note_sweep_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='error_kind',
+            field=models.CharField(blank=True, choices=[('transient', 'Transient'), ('rate_limited', 'Rate limited'), ('permanent', 'Permanent'), ('credentials', 'Credentials')], default='', max_length=12, verbose_name='Kind of error'),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('published_x', 'Published in X'), ('published_n', 'Published in Nostr'), ('published', 'Published'), ('dead_letter', 'Failed')], default='pending', max_length=12, verbose_name='State'),
+        ),
+        migrations.RunPython(errors_to_dead_letters, dead_letters_to_errors),
+    ]
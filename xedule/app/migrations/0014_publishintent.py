@@ -0,0 +1,40 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_note_dead_letter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='note',
+            name='error_kind',
+            field=models.CharField(blank=True, choices=[('transient', 'Transient'), ('rate_limited', 'Rate limited'), ('permanent', 'Permanent'), ('credentials', 'Credentials'), ('in_doubt', 'Publish in doubt')], default='', max_length=12, verbose_name='Kind of error'),
+        ),
+        migrations.CreateModel(
+            name='PublishIntent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(max_length=12, verbose_name='Platform')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('published', 'Published')], default='pending', max_length=12, verbose_name='State')),
+                ('platform_id', models.CharField(blank=True, default='', help_text='The ID of the post, once known', max_length=64, verbose_name='Platform ID')),
+                ('claimed_by', models.CharField(blank=True, max_length=255, verbose_name='Claimed by')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='publish_intents', to='app.note', verbose_name='Note')),
+            ],
+            options={
+                'verbose_name': 'Publish intent',
+                'verbose_name_plural': 'Publish intents',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='publishintent',
+            constraint=models.UniqueConstraint(fields=('note', 'platform'), name='publish_intent_note_platform_unique'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_publishintent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(max_length=12, verbose_name='Platform')),
+                ('target', models.CharField(max_length=255, verbose_name='Target')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='pending', max_length=12, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_at', models.DateTimeField(blank=True, help_text='Empty once the target is delivered or given up', null=True, verbose_name='Next attempt')),
+                ('latency', models.FloatField(blank=True, help_text='Time the target took to take the note, in seconds', null=True, verbose_name='Latency (s)')),
+                ('remote_id', models.CharField(blank=True, max_length=64, verbose_name='Remote ID')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Delivered at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Note delivery',
+                'verbose_name_plural': 'Note deliveries',
+            },
+        ),
+        migrations.AddField(
+            model_name='notedelivery',
+            name='note',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='app.note', verbose_name='Note'),
+        ),
+        migrations.AddIndex(
+            model_name='notedelivery',
+            index=models.Index(condition=models.Q(('status', 'delivered'), _negated=True), fields=['next_attempt_at'], name='note_delivery_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notedelivery',
+            constraint=models.UniqueConstraint(fields=('note', 'platform', 'target'), name='note_delivery_target_unique'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:13
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+def platform_statuses_to_partial(apps, schema_editor):
+    Note = apps.get_model("app", "Note")
+    Note.objects.filter(status__in=["published_x", "published_n"]).update(
+        status="partial",
+    )
+
+
+def partial_to_platform_statuses(apps, schema_editor):
+    Note = apps.get_model("app", "Note")
+    Note.objects.filter(status="partial").exclude(tweet_id="").update(
+        status="published_x",
+    )
+    Note.objects.filter(status="partial").update(status="published_n")
+
+
+class Migration(migrations.Migration):
+    # Rebuild the due indexes without locking writes on a large note table
+    atomic = False
+
+    dependencies = [
+        ('app', '0015_notedelivery'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='note',
+            name='note_due_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='note',
+            name='note_sweep_idx',
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('partial', 'Partially published'), ('published', 'Published'), ('dead_letter', 'Failed')], default='pending', max_length=12, verbose_name='State'),
+        ),
+        migrations.RunPython(
+            platform_statuses_to_partial,
+            partial_to_platform_statuses,
+        ),
+        AddIndexConcurrently(
+            model_name='note',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'partial'))), fields=['scheduled_time', 'user'], name='note_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='note',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'partial'))), fields=['user', 'scheduled_time', 'id'], name='note_sweep_idx'),
+        ),
+    ]
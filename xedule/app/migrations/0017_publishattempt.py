@@ -0,0 +1,39 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_note_partial_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(max_length=12, verbose_name='Platform')),
+                ('outcome', models.CharField(choices=[('published', 'Published'), ('failed', 'Failed'), ('deferred', 'Deferred')], max_length=12, verbose_name='Outcome')),
+                ('error_kind', models.CharField(blank=True, choices=[('transient', 'Transient'), ('rate_limited', 'Rate limited'), ('permanent', 'Permanent'), ('credentials', 'Credentials'), ('in_doubt', 'Publish in doubt')], max_length=12, verbose_name='Kind of error')),
+                ('error_class', models.CharField(blank=True, max_length=100, verbose_name='Error class')),
+                ('http_status', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='HTTP status')),
+                ('relay_count', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Relays')),
+                ('relays_accepted', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Relays that accepted')),
+                ('queued_at', models.DateTimeField(blank=True, help_text='When the platform task was sent to its queue', null=True, verbose_name='Queued at')),
+                ('claimed_at', models.DateTimeField(blank=True, help_text='When a worker started the platform task', null=True, verbose_name='Claimed at')),
+                ('signed_at', models.DateTimeField(blank=True, null=True, verbose_name='Signed at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent at')),
+                ('acked_at', models.DateTimeField(blank=True, null=True, verbose_name='Acked at')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='publish_attempts', to='app.note', verbose_name='Note')),
+            ],
+            options={
+                'verbose_name': 'Publish attempt',
+                'verbose_name_plural': 'Publish attempts',
+                'indexes': [models.Index(fields=['created_at'], name='publish_attempt_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_publishattempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='trace_context',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Trace of the request that created the note, carried into publishing', verbose_name='Trace context'),
+        ),
+    ]
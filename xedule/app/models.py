@@ -2,13 +2,23 @@ from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+# Notes in these states still have something to publish
+DUE_STATUSES = ("pending", "partial")
+
 
 class Note(models.Model):
     STATUS_CHOICES = (
         ("pending", "Pending"),
-        ("published_x", "Published in X"),
-        ("published_n", "Published in Nostr"),
+        ("partial", "Partially published"),
         ("published", "Published"),
+        ("dead_letter", "Failed"),
+    )
+    ERROR_KIND_CHOICES = (
+        ("transient", "Transient"),
+        ("rate_limited", "Rate limited"),
+        ("permanent", "Permanent"),
+        ("credentials", "Credentials"),
+        ("in_doubt", "Publish in doubt"),
     )
 
     user = models.ForeignKey(
@@ -61,15 +71,88 @@ class Note(models.Model):
         verbose_name="Nostr ID",
     )
     last_error = models.TextField(blank=True, default="", verbose_name="Last error")
+    error_kind = models.CharField(
+        max_length=12,
+        choices=ERROR_KIND_CHOICES,
+        blank=True,
+        default="",
+        verbose_name="Kind of error",
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Failed attempts",
+    )
+    next_attempt_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Next attempt",
+    )
+    claimed_by = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        verbose_name="Claimed by",
+    )
+    claimed_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Claimed until",
+    )
+    trace_context = models.JSONField(
+        blank=True,
+        default=dict,
+        editable=False,
+        verbose_name="Trace context",
+        help_text="Trace of the request that created the note, carried into publishing",
+    )
+    # Bumped on every write, so publishers can tell if the note changed under them
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
         verbose_name = "Note"
         verbose_name_plural = "Tweets"
+        indexes = [
+            # The publish scan: only notes with something left to publish
+            models.Index(
+                fields=["scheduled_time", "user"],
+                condition=models.Q(status__in=DUE_STATUSES),
+                name="note_due_idx",
+            ),
+            # The publish run: due notes in (user, scheduled_time, id) order,
+            # so each keyset page is read straight off the index
+            models.Index(
+                fields=["user", "scheduled_time", "id"],
+                condition=models.Q(status__in=DUE_STATUSES),
+                name="note_sweep_idx",
+            ),
+            # The user's note list
+            models.Index(fields=["user", "created_at"], name="note_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.content[:30]}... ({self.status})"
 
+    def save(self, *args, **kwargs):
+        self.version += 1
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
+
+    @property
+    def due_at(self):
+        """
+        When the note should next be published, None if nothing is left.
+
+        A note without a scheduled time is due as soon as it is created.
+        """
+        if self.status not in DUE_STATUSES:
+            return None
+        due_at = self.scheduled_time or self.created_at
+        if self.next_attempt_at and self.next_attempt_at > due_at:
+            due_at = self.next_attempt_at
+        return due_at
+
 
 class TwitterCredentials(models.Model):
     user = models.OneToOneField(
@@ -123,3 +206,252 @@ class NostrCredentials(models.Model):
         if not self.relay_urls:
             return []
         return [url.strip() for url in self.relay_urls.split("\n") if url.strip()]
+
+
+class RelayStats(models.Model):
+    """Publishing health of a single Nostr relay, aggregated over all workers."""
+
+    url = models.CharField(_("Relay URL"), max_length=255, unique=True)
+    publishes = models.PositiveIntegerField(_("Publishes"), default=0)
+    failures = models.PositiveIntegerField(_("Failures"), default=0)
+    consecutive_failures = models.PositiveIntegerField(
+        _("Consecutive failures"),
+        default=0,
+    )
+    total_connect_time = models.FloatField(_("Total connect time (s)"), default=0)
+    total_ack_time = models.FloatField(_("Total ack time (s)"), default=0)
+    total_time = models.FloatField(
+        _("Total time spent (s)"),
+        default=0,
+        help_text=_("Wall time spent waiting on this relay, timeouts included"),
+    )
+    last_error = models.TextField(_("Last error"), blank=True, default="")
+    last_failure_at = models.DateTimeField(_("Last failure"), blank=True, null=True)
+    circuit_open_until = models.DateTimeField(
+        _("Skipped until"),
+        blank=True,
+        null=True,
+        help_text=_("The relay is not published to until this time"),
+    )
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Relay stats")
+        verbose_name_plural = _("Relay stats")
+
+    def __str__(self):
+        return self.url
+
+    @property
+    def failure_rate(self):
+        if not self.publishes:
+            return 0.0
+        return self.failures / self.publishes
+
+    @property
+    def avg_connect_time(self):
+        if not self.publishes:
+            return 0.0
+        return self.total_connect_time / self.publishes
+
+    @property
+    def avg_ack_time(self):
+        acks = self.publishes - self.failures
+        if acks <= 0:
+            return 0.0
+        return self.total_ack_time / acks
+
+
+class PublishIntent(models.Model):
+    """
+    A post about to be made to a platform, written before the API call.
+
+    Twitter has no idempotency key, so a worker that dies between posting
+    and storing the tweet id would post again on the next attempt. An
+    intent still pending when the next attempt starts means a previous one
+    may have posted: the note is held until someone resolves the intent.
+    """
+
+    STATE_CHOICES = (
+        ("pending", "Pending"),
+        ("published", "Published"),
+    )
+
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name="publish_intents",
+        verbose_name=_("Note"),
+    )
+    platform = models.CharField(_("Platform"), max_length=12)
+    state = models.CharField(
+        _("State"),
+        max_length=12,
+        choices=STATE_CHOICES,
+        default="pending",
+    )
+    platform_id = models.CharField(
+        _("Platform ID"),
+        max_length=64,
+        blank=True,
+        default="",
+        help_text=_("The ID of the post, once known"),
+    )
+    claimed_by = models.CharField(_("Claimed by"), max_length=255, blank=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Publish intent")
+        verbose_name_plural = _("Publish intents")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["note", "platform"],
+                name="publish_intent_note_platform_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.platform} post of note {self.note_id} ({self.state})"
+
+
+class NoteDelivery(models.Model):
+    """
+    Delivery of a note to one target of a platform.
+
+    A target is a Nostr relay URL or the X account id. Each target keeps its
+    own status and attempts, so a note published to some relays is only
+    sent again to the ones that failed.
+    """
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("delivered", "Delivered"),
+        ("failed", "Failed"),
+    )
+
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name="deliveries",
+        verbose_name=_("Note"),
+    )
+    platform = models.CharField(_("Platform"), max_length=12)
+    target = models.CharField(_("Target"), max_length=255)
+    status = models.CharField(
+        _("Status"),
+        max_length=12,
+        choices=STATUS_CHOICES,
+        default="pending",
+    )
+    attempts = models.PositiveSmallIntegerField(_("Attempts"), default=0)
+    next_attempt_at = models.DateTimeField(
+        _("Next attempt"),
+        blank=True,
+        null=True,
+        help_text=_("Empty once the target is delivered or given up"),
+    )
+    latency = models.FloatField(
+        _("Latency (s)"),
+        blank=True,
+        null=True,
+        help_text=_("Time the target took to take the note, in seconds"),
+    )
+    remote_id = models.CharField(_("Remote ID"), max_length=64, blank=True)
+    last_error = models.TextField(_("Last error"), blank=True, default="")
+    delivered_at = models.DateTimeField(_("Delivered at"), blank=True, null=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Note delivery")
+        verbose_name_plural = _("Note deliveries")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["note", "platform", "target"],
+                name="note_delivery_target_unique",
+            ),
+        ]
+        indexes = [
+            # Undelivered targets by the time they are due again
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=~models.Q(status="delivered"),
+                name="note_delivery_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Note {self.note_id} to {self.target} ({self.status})"
+
+
+class PublishAttempt(models.Model):
+    """
+    One call to a platform to publish a note, with the timeline of the call.
+
+    Rows are written in batches by PublishAttemptLog and pruned after
+    PUBLISH_ATTEMPT_RETENTION days.
+    """
+
+    OUTCOME_CHOICES = (
+        ("published", "Published"),
+        ("failed", "Failed"),
+        ("deferred", "Deferred"),
+    )
+
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name="publish_attempts",
+        verbose_name=_("Note"),
+    )
+    platform = models.CharField(_("Platform"), max_length=12)
+    outcome = models.CharField(_("Outcome"), max_length=12, choices=OUTCOME_CHOICES)
+    error_kind = models.CharField(
+        _("Kind of error"),
+        max_length=12,
+        choices=Note.ERROR_KIND_CHOICES,
+        blank=True,
+    )
+    error_class = models.CharField(_("Error class"), max_length=100, blank=True)
+    http_status = models.PositiveSmallIntegerField(
+        _("HTTP status"),
+        blank=True,
+        null=True,
+    )
+    relay_count = models.PositiveSmallIntegerField(
+        _("Relays"),
+        blank=True,
+        null=True,
+    )
+    relays_accepted = models.PositiveSmallIntegerField(
+        _("Relays that accepted"),
+        blank=True,
+        null=True,
+    )
+    queued_at = models.DateTimeField(
+        _("Queued at"),
+        blank=True,
+        null=True,
+        help_text=_("When the platform task was sent to its queue"),
+    )
+    claimed_at = models.DateTimeField(
+        _("Claimed at"),
+        blank=True,
+        null=True,
+        help_text=_("When a worker started the platform task"),
+    )
+    signed_at = models.DateTimeField(_("Signed at"), blank=True, null=True)
+    sent_at = models.DateTimeField(_("Sent at"), blank=True, null=True)
+    acked_at = models.DateTimeField(_("Acked at"), blank=True, null=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Publish attempt")
+        verbose_name_plural = _("Publish attempts")
+        indexes = [
+            # Pruning of old attempts
+            models.Index(fields=["created_at"], name="publish_attempt_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.platform} attempt of note {self.note_id} ({self.outcome})"
@@ -0,0 +1,24 @@
+import functools
+import os
+
+
+class _PerProcess:
+    def __init__(self, factory):
+        self._for_process = functools.cache(lambda pid, *args: factory(*args))
+        functools.update_wrapper(self, factory)
+
+    def __call__(self, *args):
+        return self._for_process(os.getpid(), *args)
+
+    def cache_clear(self):
+        self._for_process.cache_clear()
+
+
+def per_process(factory):
+    """
+    Decorate `factory` so it builds its object once per process and argument.
+
+    Keyed by pid so that forked Celery worker processes never share the
+    threads, sockets or event loop of their parent.
+    """
+    return _PerProcess(factory)
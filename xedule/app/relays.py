@@ -0,0 +1,434 @@
+import asyncio
+import json
+import logging
+import ssl
+import threading
+import time
+from datetime import UTC
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models import Q
+from django.utils import timezone
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from .models import RelayStats
+from .processes import per_process
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_MIN = 1  # seconds
+RECONNECT_DELAY_MAX = 60  # seconds
+CONNECT_TIMEOUT = 10  # seconds
+
+
+def _ssl_context():
+    """SSL context used for wss:// relays."""
+    context = ssl.create_default_context()
+    # NOTE: This disables ssl certificate verification
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def _relay_result(url):
+    """Empty per-relay result, filled in while publishing."""
+    return {
+        "url": url,
+        "accepted": False,
+        "message": "",
+        "connect_time": None,
+        "ack_time": None,
+        "elapsed": None,
+    }
+
+
+class RelayConnection:
+    """
+    A single long-lived websocket connection to a relay.
+
+    The connection lives on the pool's event loop. It reconnects with an
+    exponential backoff when the relay drops it, and keeps itself alive with
+    websocket pings. OK replies are routed to the publisher waiting for them.
+    """
+
+    def __init__(self, url, keepalive):
+        self.url = url
+        self.keepalive = keepalive
+        self.last_used = time.monotonic()
+        self.connected = asyncio.Event()
+        self._websocket = None
+        self._waiters = {}
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        delay = RECONNECT_DELAY_MIN
+        ssl_context = _ssl_context() if self.url.startswith("wss://") else None
+        while True:
+            try:
+                async with connect(
+                    self.url,
+                    ssl=ssl_context,
+                    open_timeout=CONNECT_TIMEOUT,
+                    ping_interval=self.keepalive,
+                    ping_timeout=self.keepalive,
+                ) as websocket:
+                    self._websocket = websocket
+                    self.connected.set()
+                    delay = RECONNECT_DELAY_MIN
+                    logger.debug("Connected to relay %s", self.url)
+                    await self._read_replies(websocket)
+            except (OSError, WebSocketException, TimeoutError) as e:
+                logger.debug("Connection to relay %s failed: %s", self.url, e)
+            finally:
+                self._disconnected()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    async def _read_replies(self, websocket):
+        async for raw_reply in websocket:
+            try:
+                reply = json.loads(raw_reply)
+            except ValueError:
+                continue
+            # ["OK", <event_id>, <true|false>, <message>]
+            if isinstance(reply, list) and len(reply) >= 3 and reply[0] == "OK":  # noqa: PLR2004
+                waiter = self._waiters.pop(reply[1], None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(reply)
+
+    def _disconnected(self):
+        self._websocket = None
+        self.connected.clear()
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.set_exception(ConnectionError("Connection lost"))
+        self._waiters.clear()
+
+    async def _send(self, message):
+        if self._websocket is None:
+            # The connection dropped again before the event went out
+            msg = "Connection lost"
+            raise ConnectionError(msg)
+        await self._websocket.send(message)
+
+    async def publish(self, message, event_id, result):
+        """Send an EVENT message and wait for the relay's NIP-20 OK reply."""
+        self.last_used = time.monotonic()
+        start = time.monotonic()
+        await self.connected.wait()
+        result["connect_time"] = time.monotonic() - start
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[event_id] = waiter
+        try:
+            sent = time.monotonic()
+            await self._send(message)
+            reply = await waiter
+        except (OSError, WebSocketException) as e:
+            result["message"] = str(e) or e.__class__.__name__
+        else:
+            result["accepted"] = bool(reply[2])
+            result["message"] = reply[3] if len(reply) > 3 else ""  # noqa: PLR2004
+            result["ack_time"] = time.monotonic() - sent
+        finally:
+            self._waiters.pop(event_id, None)
+        result["elapsed"] = time.monotonic() - start
+        return result
+
+    async def close(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class RelayPool:
+    """
+    Relay connections shared by every publish in this process.
+
+    The pool runs its own event loop in a daemon thread and keeps one
+    connection per relay URL, so consecutive notes reuse warm connections
+    instead of opening new ones. Connections unused for `idle_timeout`
+    seconds are closed.
+    """
+
+    def __init__(self, keepalive, idle_timeout):
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self._connections = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="nostr-relay-pool",
+            daemon=True,
+        )
+        self._thread.start()
+        self._reaper = asyncio.run_coroutine_threadsafe(
+            self._close_idle_connections(),
+            self._loop,
+        )
+
+    def _connection(self, url):
+        connection = self._connections.get(url)
+        if connection is None:
+            connection = RelayConnection(url, self.keepalive)
+            self._connections[url] = connection
+        return connection
+
+    async def _connect(self, relays):
+        for url in relays:
+            self._connection(url)
+
+    def connect(self, relays):
+        """Open connections to the given relays in the background."""
+        asyncio.run_coroutine_threadsafe(self._connect(relays), self._loop)
+
+    async def _publish(self, relays, event, deadline):
+        message = event.to_message()
+        results = {url: _relay_result(url) for url in relays}
+        tasks = [
+            asyncio.create_task(
+                self._connection(url).publish(message, event.id, result),
+            )
+            for url, result in results.items()
+        ]
+        if not tasks:
+            return results
+
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        for result in results.values():
+            if result["elapsed"] is None:
+                result["elapsed"] = deadline
+            if result["ack_time"] is None and not result["message"]:
+                if result["connect_time"] is None:
+                    result["message"] = f"Not connected within {deadline} seconds"
+                else:
+                    result["message"] = f"No OK reply within {deadline} seconds"
+        return results
+
+    def publish(self, relays, event, deadline):
+        """
+        Publish a signed event to every relay concurrently.
+
+        Blocks until every relay has answered with an OK message or
+        `deadline` seconds have passed, whichever comes first.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._publish(relays, event, deadline),
+            self._loop,
+        ).result()
+
+    async def _close_idle_connections(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 60))
+            now = time.monotonic()
+            for url, connection in list(self._connections.items()):
+                if now - connection.last_used > self.idle_timeout:
+                    del self._connections[url]
+                    await connection.close()
+                    logger.debug("Closed idle connection to relay %s", url)
+
+    async def _close(self):
+        connections = list(self._connections.values())
+        self._connections.clear()
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+    def close(self):
+        """Close every connection and stop the pool's event loop."""
+        self._reaper.cancel()
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class RelayHealth:
+    """
+    Health tracking and circuit breaker for relays, per process.
+
+    A relay that fails `failure_threshold` publishes in a row is skipped for
+    `cooldown` seconds. Once the cool-down is over a single publish is let
+    through as a probe: the circuit closes again if the relay accepts it and
+    stays open for another cool-down otherwise.
+
+    Counters are accumulated in memory and written to RelayStats by flush(),
+    which also picks up circuits opened by other worker processes and drops
+    those closed from the admin.
+    """
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive_failures = {}
+        self._open_until = {}
+        self._probing = set()
+        self._pending = {}
+        # Circuits opened since the last flush
+        self._opened = set()
+
+    def available(self, relays):
+        """Return the relays whose circuit is closed or ready for a probe."""
+        now = time.time()
+        available = []
+        with self._lock:
+            for url in relays:
+                open_until = self._open_until.get(url)
+                if open_until is None:
+                    available.append(url)
+                elif now >= open_until and url not in self._probing:
+                    self._probing.add(url)
+                    available.append(url)
+        return available
+
+    def record(self, results):
+        """Record the outcome of a publish for every relay in `results`."""
+        now = time.time()
+        with self._lock:
+            for url, result in results.items():
+                self._probing.discard(url)
+                pending = self._pending.setdefault(
+                    url,
+                    {
+                        "publishes": 0,
+                        "failures": 0,
+                        "connect_time": 0.0,
+                        "ack_time": 0.0,
+                        "time": 0.0,
+                        "last_error": "",
+                        "last_failure_at": None,
+                    },
+                )
+                pending["publishes"] += 1
+                pending["connect_time"] += result["connect_time"] or 0.0
+                pending["time"] += result["elapsed"] or 0.0
+
+                if result["accepted"]:
+                    pending["ack_time"] += result["ack_time"]
+                    self._consecutive_failures[url] = 0
+                    self._open_until.pop(url, None)
+                    continue
+
+                pending["failures"] += 1
+                pending["last_error"] = result["message"]
+                pending["last_failure_at"] = now
+                failures = self._consecutive_failures.get(url, 0) + 1
+                self._consecutive_failures[url] = failures
+                if failures >= self.failure_threshold:
+                    self._open_until[url] = now + self.cooldown
+                    self._opened.add(url)
+                    logger.warning(
+                        "Relay %s failed %s times in a row, skipping it for %s seconds",
+                        url,
+                        failures,
+                        self.cooldown,
+                    )
+
+    def flush(self):
+        """Write the accumulated counters to RelayStats and sync circuits."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            opened, self._opened = self._opened, set()
+            consecutive_failures = dict(self._consecutive_failures)
+            open_until = dict(self._open_until)
+
+        now = timezone.now()
+        for url, counters in pending.items():
+            RelayStats.objects.get_or_create(url=url)
+            changes = {
+                "publishes": F("publishes") + counters["publishes"],
+                "failures": F("failures") + counters["failures"],
+                "total_connect_time": F("total_connect_time")
+                + counters["connect_time"],
+                "total_ack_time": F("total_ack_time") + counters["ack_time"],
+                "total_time": F("total_time") + counters["time"],
+                "consecutive_failures": consecutive_failures.get(url, 0),
+                "updated_at": now,
+            }
+            if url in opened:
+                changes["circuit_open_until"] = datetime.fromtimestamp(
+                    open_until[url],
+                    tz=UTC,
+                )
+            elif url not in open_until:
+                changes["circuit_open_until"] = None
+            if counters["last_failure_at"] is not None:
+                changes["last_error"] = counters["last_error"]
+                changes["last_failure_at"] = datetime.fromtimestamp(
+                    counters["last_failure_at"],
+                    tz=UTC,
+                )
+            RelayStats.objects.filter(url=url).update(**changes)
+
+        circuits = RelayStats.objects.filter(
+            Q(circuit_open_until__gt=now) | Q(url__in=list(open_until)),
+        ).values_list("url", "circuit_open_until", "consecutive_failures")
+        with self._lock:
+            for url, until, failures in circuits:
+                if until is not None and until > now:
+                    # Opened here or by another process
+                    self._open_until[url] = max(
+                        self._open_until.get(url, 0),
+                        until.timestamp(),
+                    )
+                elif url not in self._opened | opened:
+                    # Closed from the admin, or its cool-down is over. The
+                    # next failure reopens it unless the admin reset the count
+                    self._open_until.pop(url, None)
+                    self._consecutive_failures[url] = failures
+                    self._probing.discard(url)
+
+
+@per_process
+def get_relay_health():
+    """Return the relay health tracker of the current process."""
+    return RelayHealth(
+        failure_threshold=settings.NOSTR_RELAY_FAILURE_THRESHOLD,
+        cooldown=settings.NOSTR_RELAY_COOLDOWN,
+    )
+
+
+@per_process
+def get_relay_pool():
+    """Return the relay pool of the current process."""
+    return RelayPool(
+        keepalive=settings.NOSTR_RELAY_KEEPALIVE,
+        idle_timeout=settings.NOSTR_RELAY_IDLE_TIMEOUT,
+    )
+
+
+def publish_event(relays, event, timeout=None):
+    """
+    Publish a signed event to the given relays and collect their replies.
+
+    Returns a dict keyed by relay URL. Each value holds whether the relay
+    accepted the event, the relay's message and the connect/ack latencies.
+    Relays with an open circuit are skipped and reported as not accepted.
+    """
+    if timeout is None:
+        timeout = settings.NOSTR_PUBLISH_TIMEOUT
+    relays = list(dict.fromkeys(relays))
+    health = get_relay_health()
+    available = health.available(relays)
+    results = get_relay_pool().publish(available, event, timeout)
+    health.record(results)
+
+    for url in relays:
+        if url not in results:
+            results[url] = _relay_result(url)
+            results[url]["message"] = "Skipped: relay keeps failing"
+    for url, result in results.items():
+        if result["accepted"]:
+            logger.debug("Relay %s accepted event %s", url, event.id)
+        else:
+            logger.warning(
+                "Relay %s did not accept event %s: %s",
+                url,
+                event.id,
+                result["message"],
+            )
+    return results
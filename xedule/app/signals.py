@@ -1,7 +1,14 @@
 # tweets/signals.py
+from django.conf import settings
 from django_celery_beat.models import IntervalSchedule
 from django_celery_beat.models import PeriodicTask
 
+from .due_index import index_notes_on_commit
+from .due_index import unindex_notes
+from .signing import get_nostr_key_cache
+from .tasks import queue_publish
+from .twitter import get_twitter_client_cache
+
 
 def create_periodic_tasks(sender, **kwargs):
     """
@@ -22,3 +29,77 @@ def create_periodic_tasks(sender, **kwargs):
             "enabled": True,
         },
     )
+
+    # Reenviar a los relays que no aceptaron un evento
+    PeriodicTask.objects.update_or_create(
+        name="Retry failed relay deliveries",
+        defaults={
+            "task": "xedule.app.tasks.retry_relay_deliveries",
+            "interval": schedule,
+            "enabled": True,
+        },
+    )
+
+    # Revisar también la base de datos, por si el índice de notas pendientes
+    # perdió alguna
+    sweep, _ = IntervalSchedule.objects.get_or_create(
+        every=settings.PUBLISH_DUE_INDEX_SWEEP_INTERVAL,
+        period=IntervalSchedule.MINUTES,
+    )
+    PeriodicTask.objects.update_or_create(
+        name="Sweep due notes from the database",
+        defaults={
+            "task": "xedule.app.tasks.publish_tweet",
+            "interval": sweep,
+            "enabled": True,
+        },
+    )
+
+    # Borrar cada día los intentos de publicación antiguos
+    daily, _ = IntervalSchedule.objects.get_or_create(
+        every=1,
+        period=IntervalSchedule.DAYS,
+    )
+    PeriodicTask.objects.update_or_create(
+        name="Prune old publish attempts",
+        defaults={
+            "task": "xedule.app.tasks.prune_publish_attempts",
+            "interval": daily,
+            "enabled": True,
+        },
+    )
+
+
+def evict_twitter_client(sender, instance, **kwargs):
+    """
+    Drop the cached Twitter client of a user whose credentials changed
+    """
+    get_twitter_client_cache().evict(instance.user_id)
+
+
+def evict_nostr_keys(sender, instance, **kwargs):
+    """
+    Drop the cached Nostr keys of a user whose credentials changed
+    """
+    get_nostr_key_cache().evict(instance.user_id)
+
+
+def update_due_index(sender, instance, **kwargs):
+    """
+    Keep the due index in step with a saved note
+    """
+    index_notes_on_commit([instance])
+
+
+def remove_from_due_index(sender, instance, **kwargs):
+    """
+    Drop a deleted note from the due index
+    """
+    unindex_notes([instance.id])
+
+
+def queue_note_publish(sender, instance, **kwargs):
+    """
+    Queue a note that is due now or soon for publishing right away
+    """
+    queue_publish([instance])
@@ -0,0 +1,149 @@
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import nostr.key as nk
+import secp256k1
+from django.conf import settings
+from nostr import bech32
+
+from .caches import CredentialsCache
+from .processes import per_process
+
+logger = logging.getLogger(__name__)
+
+KEY_LENGTH = 32  # bytes, for both private and x-only public keys
+
+
+def _decode_key(value, hrp):
+    """
+    Return the raw bytes of a key given in bech32 (`hrp`) or hex form.
+
+    Raises ValueError when `value` is not a valid key.
+    """
+    value = value.strip()
+    if value.startswith(hrp):
+        decoded_hrp, data, _ = bech32.bech32_decode(value)
+        if decoded_hrp != hrp:
+            msg = f"Invalid {hrp} key"
+            raise ValueError(msg)
+        raw = bytes(bech32.convertbits(data, 5, 8, pad=False) or b"")
+    else:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            msg = f"Expected a {hrp} or hex key"
+            raise ValueError(msg) from None
+    if len(raw) != KEY_LENGTH:
+        msg = f"Invalid {hrp} key"
+        raise ValueError(msg)
+    return raw
+
+
+def decode_private_key(value):
+    """Return the nk.PrivateKey for an nsec or hex private key."""
+    return nk.PrivateKey(_decode_key(value, "nsec"))
+
+
+def decode_public_key(value):
+    """Return the nk.PublicKey for an npub or hex public key."""
+    return nk.PublicKey(_decode_key(value, "npub"))
+
+
+class NostrKeyCache(CredentialsCache):
+    """
+    Least recently used cache of decoded Nostr keys, keyed by user.
+
+    Decoding an nsec and deriving its public key costs a bech32 decode and a
+    secp256k1 point multiplication, so it is done once per user instead of
+    once per note.
+    """
+
+    def build(self, credentials):
+        """Return (private key, hex public key) for the given credentials."""
+        private_key = decode_private_key(credentials.private_key)
+        return private_key, private_key.public_key.hex()
+
+
+@per_process
+def get_nostr_key_cache():
+    """Return the Nostr key cache of the current process."""
+    return NostrKeyCache(maxsize=settings.NOSTR_KEY_CACHE_SIZE)
+
+
+def get_nostr_keys(credentials):
+    """Return (private key, hex public key) for the given credentials."""
+    return get_nostr_key_cache().get(credentials)
+
+
+def sign_event_ids(raw_secret, event_ids):
+    """Return the Schnorr signatures of the given event ids, in order."""
+    private_key = secp256k1.PrivateKey(raw_secret)
+    return [
+        private_key.schnorr_sign(bytes.fromhex(event_id), None, raw=True).hex()
+        for event_id in event_ids
+    ]
+
+
+@per_process
+def _signing_executor(processes):
+    # Spawn instead of fork: the worker has threads of its own (the relay
+    # pool) that a forked child would inherit in an undefined state
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def get_signing_executor():
+    """
+    Return the process pool used to sign large batches of events, if any.
+
+    Returns None when NOSTR_SIGNING_PROCESSES is below 2 or when running in
+    a daemonic process, such as a child of Celery's prefork pool, which is
+    not allowed to start processes of its own. Signing is then serial.
+    """
+    processes = settings.NOSTR_SIGNING_PROCESSES or os.cpu_count() or 1
+    if processes < 2 or multiprocessing.current_process().daemon:  # noqa: PLR2004
+        return None
+    return _signing_executor(processes)
+
+
+def sign_events(private_key, events, executor=None):
+    """
+    Sign `events` in place with `private_key`.
+
+    Batches of at least NOSTR_SIGNING_BATCH_SIZE events are split over the
+    signing process pool, so a large backlog is signed on every core before
+    it is sent to the relays. Smaller batches are signed in this process,
+    where the round trip to the pool would cost more than the signing.
+    """
+    if not events:
+        return
+    event_ids = [event.id for event in events]
+    if executor is None and len(events) >= settings.NOSTR_SIGNING_BATCH_SIZE:
+        executor = get_signing_executor()
+
+    signatures = None
+    if executor is not None:
+        chunk_size = -(-len(event_ids) // executor._max_workers)  # noqa: SLF001
+        try:
+            signatures = list(
+                itertools.chain.from_iterable(
+                    executor.map(
+                        sign_event_ids,
+                        itertools.repeat(private_key.raw_secret),
+                        itertools.batched(event_ids, chunk_size),
+                    ),
+                ),
+            )
+        except BrokenProcessPool:
+            logger.exception("Signing pool failed, signing events serially")
+    if signatures is None:
+        signatures = sign_event_ids(private_key.raw_secret, event_ids)
+
+    for event, signature in zip(events, signatures, strict=True):
+        event.signature = signature
@@ -1,458 +1,1155 @@
+import functools
+import itertools
 import logging
-import ssl
+import operator
+import os
+import random
+import socket
 import time
+import typing
+import uuid
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
 
-import nostr.key as nk
+import redis
 import tweepy
+from celery import chord
 from celery import shared_task
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.concurrency.solo import TaskPool as SoloPool
+from celery.signals import worker_init
+from celery.signals import worker_process_init
+from celery.signals import worker_process_shutdown
+from celery.signals import worker_ready
+from celery.signals import worker_shutdown
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Min
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from kombu.exceptions import OperationalError
 from nostr.event import Event
-from nostr.relay_manager import RelayManager
-
-from xedule.users.models import User
-
+from prometheus_client import multiprocess
+from prometheus_client import start_http_server
+
+from .attempts import get_publish_attempt_log
+from .due_index import due_backlog
+from .due_index import index_notes_on_commit
+from .due_index import pop_due_note_ids
+from .due_index import reindex_notes
+from .locks import LeaseLock
+from .metrics import DEAD_LETTERS
+from .metrics import PUBLISH_RETRIES
+from .metrics import SKIPPED_SWEEPS_KEY
+from .metrics import SWEEP_SECONDS
+from .metrics import TWITTER_CALL_SECONDS
+from .metrics import observe_publish_lag
+from .metrics import observe_relay_results
+from .metrics import record_due_backlog
+from .metrics import worker_registry
+from .models import DUE_STATUSES
 from .models import NostrCredentials
 from .models import Note
+from .models import NoteDelivery
+from .models import PublishAttempt
+from .models import PublishIntent
 from .models import TwitterCredentials
+from .relays import get_relay_health
+from .relays import get_relay_pool
+from .relays import publish_event
+from .signing import get_nostr_keys
+from .signing import sign_events
+from .tracing import flush_traces
+from .tracing import record_note_spans
+from .tracing import record_relay_spans
+from .tracing import span
+from .twitter import acquire_tweet_quota
+from .twitter import classify_twitter_error
+from .twitter import get_twitter_client
+from .twitter import get_twitter_quota
+from .twitter import record_rate_limit
+from .twitter import twitter_account_id
+from .twitter import twitter_request_sent
 
 logger = logging.getLogger(__name__)
 
-MAX_RETRIES = 3
-BACKOFF_BASE = 2  # seconds
+SWEEP_SKIPPED = "Skipped, previous run active"
+# Errors worth another attempt later, and errors that would just happen again
+RETRYABLE_ERROR_KINDS = ("transient",)
+FINAL_ERROR_KINDS = ("permanent", "credentials", "in_doubt")
+# Old publish attempts deleted per query
+PRUNE_CHUNK_SIZE = 5000
+IN_DOUBT_ERROR = (
+    "A previous attempt may have posted this note to Twitter. "
+    "Resolve its publish intent before replaying it."
+)
 
 
-@shared_task
-def publish_tweet():
-    """Process pending tweets and publish them to Twitter and/or Nostr."""
-    # Include notes that are pending or partially published
-    pending_notes = Note.objects.filter(
-        status__in=["pending", "published_x", "published_n"],
-        scheduled_time__lte=timezone.now(),
-    )
+@worker_process_init.connect
+def _open_relay_pool(**kwargs):
+    """Connect each worker process to the default relays once, at startup."""
+    get_relay_pool().connect(settings.NOSTR_DEFAULT_RELAYS)
 
-    if not pending_notes.exists():
-        return "There are no tweets pending to be published."
 
-    # Group notes by user
-    grouped_notes = _group_tweets_by_user(pending_notes)
+@worker_process_shutdown.connect
+def _close_relay_pool(**kwargs):
+    get_relay_pool().close()
+    get_relay_health().flush()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+    flush_traces()
 
-    # Process tweets by user
-    published_count = _process_grouped_tweets(grouped_notes)
 
-    return f"Se publicaron {published_count} tweets"
+# Only prefork sends the worker process signals, and solo only the first one.
+# Other pools run tasks in the worker's own process, so hook the worker's.
 
 
-def _group_tweets_by_user(pending_notes):
-    """Group tweets by user_id."""
-    grouped_notes = {}
-    for note in pending_notes:
-        if note.user_id not in grouped_notes:
-            grouped_notes[note.user_id] = []
-        grouped_notes[note.user_id].append(note)
-    return grouped_notes
+@worker_init.connect
+def _open_worker_relay_pool(sender, **kwargs):
+    if not issubclass(get_implementation(sender.pool_cls), (PreforkPool, SoloPool)):
+        _open_relay_pool()
 
 
-def _process_grouped_tweets(grouped_notes):
-    """Process tweets grouped by user."""
-    published_count = 0
+@worker_shutdown.connect
+def _close_worker_relay_pool(sender, **kwargs):
+    if not issubclass(get_implementation(sender.pool_cls), PreforkPool):
+        _close_relay_pool()
 
-    for user_id, user_tweets in grouped_notes.items():
-        try:
-            user_published = _process_user_tweets(user_id, user_tweets)
-            published_count += user_published
-        except Exception:
-            logger.exception("Error processing tweets for user %s", user_id)
 
-    return published_count
+@worker_ready.connect
+def _serve_metrics(**kwargs):
+    """Serve the worker's Prometheus metrics on CELERY_METRICS_PORT, if set."""
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=worker_registry())
+
+
+def _due_notes():
+    """Due notes that are pending or partially published and not claimed."""
+    now = timezone.now()
+    return Note.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+        # Notes without a scheduled time are published as soon as possible
+        Q(scheduled_time__isnull=True) | Q(scheduled_time__lte=now),
+        status__in=DUE_STATUSES,
+    ).order_by()
+
+
+def _claim_notes(notes):
+    """Lease due notes to this task, skipping the rows other claims locked."""
+    claimed_by = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+    claimed_until = timezone.now() + timedelta(seconds=settings.PUBLISH_CLAIM_LEASE)
+    with transaction.atomic():
+        note_ids = list(
+            notes.select_for_update(skip_locked=True).values_list("id", flat=True),
+        )
+        Note.objects.filter(id__in=note_ids).update(
+            claimed_by=claimed_by,
+            claimed_until=claimed_until,
+        )
+    return list(
+        Note.objects.filter(claimed_by=claimed_by)
+        .select_related("user__twitter_credentials", "user__nostr_credentials")
+        .order_by(),
+    )
 
 
-def _process_user_tweets(user_id, user_notes):
-    """Process tweets for a specific user."""
+def _release_notes(notes):
+    """Give up the claim on the given notes."""
+    Note.objects.filter(
+        id__in=[note.id for note in notes],
+        claimed_by=notes[0].claimed_by,
+    ).update(claimed_by="", claimed_until=None)
+
+
+@shared_task
+def publish_tweet(note_ids=None, after=None):
+    """
+    Dispatch the due notes, or those of `note_ids`, to per-user tasks.
+
+    A run that uses up PUBLISH_SWEEP_TIME_BUDGET queues a new run that
+    continues `after` the last dispatched note.
+    """
+    lock = _sweep_lock()
+    if not lock.acquire():
+        _record_skipped_sweep()
+        if note_ids is not None:
+            # Make the notes taken from the index due again
+            reindex_notes(note_ids)
+        return SWEEP_SKIPPED
     try:
-        user = User.objects.get(id=user_id)
-
-        # Initialize clients as None to track which platforms are available
-        twitter_client = None
-        nostr_client_data = None
-
-        # Try to get Twitter credentials
-        try:
-            twitter_credentials = TwitterCredentials.objects.get(user=user)
-            twitter_client = _create_twitter_client(twitter_credentials)
-            logger.info("Twitter client created successfully for user %s", user_id)
-        except TwitterCredentials.DoesNotExist:
-            logger.info(
-                "User %s does not have Twitter credentials configured.", user_id
-            )
+        with SWEEP_SECONDS.time(), span("publish_tweet"):
+            message, checkpoint = _dispatch_due_notes(note_ids, after)
+    finally:
+        lock.release()
 
-        # Try to get Nostr credentials
-        try:
-            nostr_credentials = NostrCredentials.objects.get(user=user)
-            if nostr_credentials.private_key:
-                nostr_client_data = {
-                    "private_key": nostr_credentials.private_key,
-                    "public_key": nostr_credentials.public_key,
-                    "relays": nostr_credentials.get_relay_list(),
-                }
-                logger.info(
-                    "Nostr credentials loaded successfully for user %s", user_id
-                )
-            else:
-                logger.warning(
-                    "User %s has incomplete Nostr credentials (missing private key or relays)",
-                    user_id,
-                )
-        except NostrCredentials.DoesNotExist:
-            logger.info("User %s does not have Nostr credentials configured.", user_id)
+    if checkpoint is not None:
+        # Queued once the lock is free, so the new run can take it
+        publish_tweet.delay(note_ids, checkpoint)
+    return message
+
+
+def _sweep_lock():
+    return LeaseLock("publish-sweep", settings.PUBLISH_SWEEP_LOCK_TIMEOUT)
 
-        # Check if we have any platform to publish to
-        if not twitter_client and not nostr_client_data:
-            _mark_tweets_with_error(
-                user_notes, "User does not have any platform credentials configured"
-            )
-            logger.error(
-                "User %s has no platform credentials. No notes published.", user_id
-            )
-            return 0
 
-        # Publish the tweets to available platforms
-        return _publish_user_tweets_refactored(
-            user_notes, twitter_client, nostr_client_data
+def _record_skipped_sweep():
+    """Count a run skipped because the previous one was still active."""
+    cache.add(SKIPPED_SWEEPS_KEY, 0, timeout=None)
+    cache.incr(SKIPPED_SWEEPS_KEY)
+    logger.info("Skipped publish run, the previous run is still active")
+
+
+def _sweep_notes():
+    """Due notes in the order of the publish run, that of note_sweep_idx."""
+    return _due_notes().order_by(
+        "user_id",
+        # The PostgreSQL default for ascending order, spelled out for others
+        F("scheduled_time").asc(nulls_last=True),
+        "id",
+    )
+
+
+def _after_checkpoint(checkpoint):
+    """Filter for the notes after `checkpoint`, a [user_id, ISO time, id] row."""
+    user_id, scheduled_time, note_id = checkpoint
+    later_user = Q(user_id__gt=user_id)
+    if scheduled_time is None:
+        later = later_user | Q(
+            user_id=user_id,
+            scheduled_time__isnull=True,
+            id__gt=note_id,
+        )
+    else:
+        scheduled_time = datetime.fromisoformat(scheduled_time)
+        later = later_user | Q(
+            Q(scheduled_time__gt=scheduled_time)
+            | Q(scheduled_time=scheduled_time, id__gt=note_id)
+            | Q(scheduled_time__isnull=True),
+            user_id=user_id,
         )
+    # Redundant, but lets the scan of note_sweep_idx start at the user
+    return Q(user_id__gte=user_id) & later
+
+
+def _dispatch_page(rows):
+    """Queue the tasks of a page, returning note ids, task count and checkpoint."""
+    subtasks = []
+    note_ids = []
+    checkpoint = None
+    for user_id, user_rows in itertools.groupby(rows, key=operator.itemgetter(0)):
+        for batch in itertools.batched(user_rows, settings.PUBLISH_BATCH_SIZE):
+            batch_ids = [note_id for _, _, note_id in batch]
+            subtasks.append(publish_user_notes.s(user_id, batch_ids))
+            note_ids.extend(batch_ids)
+            _, scheduled_time, note_id = batch[-1]
+            checkpoint = [
+                user_id,
+                scheduled_time.isoformat() if scheduled_time else None,
+                note_id,
+            ]
+    if subtasks:
+        chord(subtasks)(collect_published_count.s())
+    return note_ids, len(subtasks), checkpoint
+
+
+def _dispatch_due_notes(note_ids, after):
+    """Dispatch the due notes by page; returns a summary and where to resume."""
+    deadline = time.monotonic() + settings.PUBLISH_SWEEP_TIME_BUDGET
+    due_notes = _sweep_notes()
+    if note_ids is not None:
+        due_notes = due_notes.filter(id__in=note_ids)
+
+    dispatched = set()
+    notes_count = tasks_count = 0
+    checkpoint = after
+    while True:
+        page = due_notes
+        if checkpoint is not None:
+            page = page.filter(_after_checkpoint(checkpoint))
+        rows = page.values_list("user_id", "scheduled_time", "id")[
+            : settings.PUBLISH_SWEEP_PAGE_SIZE
+        ]
+
+        page_ids, page_tasks, page_checkpoint = _dispatch_page(rows.iterator())
+        checkpoint = page_checkpoint or checkpoint
+        page_size = len(page_ids)
+        notes_count += page_size
+        tasks_count += page_tasks
+        if note_ids is not None:
+            dispatched.update(page_ids)
+
+        if page_size < settings.PUBLISH_SWEEP_PAGE_SIZE:
+            checkpoint = None
+            break
+        if time.monotonic() > deadline:
+            logger.info("Publish run out of time, continuing after %s", checkpoint)
+            break
 
-    except User.DoesNotExist:
-        _mark_tweets_with_error(user_notes, "User does not exist")
-        for note in user_notes:
-            logger.exception(
-                "User %s does not exist. Note %s not published.", user_id, note.id
-            )
+    if note_ids is not None and after is None and checkpoint is None:
+        # Fix the index entries of notes that turned out not to be due
+        reindex_notes(set(note_ids) - dispatched)
+
+    if not notes_count:
+        return "There are no tweets pending to be published.", checkpoint
+    return f"Dispatched {notes_count} notes in {tasks_count} tasks", checkpoint
+
+
+@shared_task(bind=True)
+def publish_user_notes(self, user_id, note_ids):
+    """Claim a user's notes and publish them with one task per platform queue."""
+    # The notes may have been published, edited or claimed by another worker
+    # since they were dispatched
+    claim_started = time.time()
+    user_notes = _claim_notes(_due_notes().filter(user_id=user_id, id__in=note_ids))
+    record_note_spans("db.claim", user_notes, claim_started, time.time())
+    if not user_notes:
+        return 0
+    claimed_by = user_notes[0].claimed_by
+    claimed_ids = [note.id for note in user_notes]
+
+    user = user_notes[0].user
+    if not _has_credentials(user, "twitter_credentials") and not _has_credentials(
+        user, "nostr_credentials"
+    ):
+        _mark_tweets_with_error(
+            user_notes,
+            "User does not have any platform credentials configured",
+            "credentials",
+        )
+        reindex_notes(claimed_ids)
+        logger.error(
+            "User %s has no platform credentials. No notes published.", user_id
+        )
         return 0
 
+    queued_at = timezone.now().isoformat()
+    platform_tasks = [
+        task.s(user_id, claimed_ids, claimed_by, queued_at)
+        for task, needs_platform in (
+            (publish_notes_to_twitter, _needs_twitter),
+            (publish_notes_to_nostr, _needs_nostr),
+        )
+        if any(needs_platform(note) for note in user_notes)
+    ]
+    finish = finish_user_notes.s(user_id, claimed_ids, claimed_by)
+    if not platform_tasks:
+        return finish_user_notes([], user_id, claimed_ids, claimed_by)
+    return self.replace(chord(platform_tasks, finish))
 
-def _create_twitter_client(credentials):
-    """Create a Twitter API client using user credentials."""
-    return tweepy.Client(
-        consumer_key=credentials.api_key,
-        consumer_secret=credentials.api_secret_key,
-        access_token=credentials.access_token,
-        access_token_secret=credentials.access_token_secret,
-    )
 
+@shared_task
+def collect_published_count(results):
+    """Add up the notes published by the publish_user_notes tasks of a run."""
+    published_count = sum(results)
+    logger.info("Se publicaron %s tweets", published_count)
+    return f"Se publicaron {published_count} tweets"
 
-def _publish_user_tweets_refactored(notes, twitter_client, nostr_client_data):
-    """Publish notes for a user with the given clients."""
-    published_count = 0
 
+def _has_credentials(user, related_name):
+    try:
+        getattr(user, related_name)
+    except ObjectDoesNotExist:
+        return False
+    return True
+
+
+def _needs_twitter(note):
+    return note.publish_to_x and not note.tweet_id
+
+
+def _needs_nostr(note):
+    return note.publish_to_nostr and not note.nostr_id
+
+
+def queue_publish(notes):
+    """
+    Queue publish tasks for notes due now or within PUBLISH_ETA_HORIZON.
+
+    The periodic task still publishes anything these tasks miss.
+    """
+    now = timezone.now()
+    horizon = now + timedelta(seconds=settings.PUBLISH_ETA_HORIZON)
+
+    batches: dict[tuple[int, datetime | None], list[int]] = {}
     for note in notes:
-        # Actualizar la nota desde la base de datos para evitar usar datos en caché
-        note.refresh_from_db()
+        due_at = note.due_at
+        if due_at is None or (due_at > now and due_at > horizon):
+            continue
+        eta = due_at if due_at > now else None
+        batches.setdefault((note.user_id, eta), []).append(note.id)
+
+    for (user_id, eta), note_ids in batches.items():
+        for batch in itertools.batched(note_ids, settings.PUBLISH_BATCH_SIZE):
+            transaction.on_commit(
+                functools.partial(_send_publish_task, user_id, list(batch), eta),
+            )
 
-        # Procesar la nota para su publicación
-        result = _process_single_tweet(note, twitter_client, nostr_client_data)
 
-        if result["all_completed"]:
-            published_count += 1
-            _log_successful_publish(note, result["twitter_id"], result["nostr_id"])
+def _send_publish_task(user_id, note_ids, eta):
+    try:
+        publish_user_notes.apply_async((user_id, note_ids), eta=eta)
+    except OperationalError:
+        # The note is already saved: the periodic task will publish it
+        logger.exception("Could not queue notes %s for publishing", note_ids)
+
+
+def replay_dead_letters(notes):
+    """Send the dead-lettered notes among `notes` back to be published."""
+    note_ids = list(notes.filter(status="dead_letter").values_list("id", flat=True))
+    Note.objects.filter(id__in=note_ids, status="dead_letter").update(
+        status=Case(
+            When(~Q(tweet_id="") | ~Q(nostr_id=""), then=Value("partial")),
+            default=Value("pending"),
+        ),
+        attempts=0,
+        next_attempt_at=None,
+        last_error="",
+        error_kind="",
+        version=F("version") + 1,
+    )
+    replayed = list(
+        Note.objects.filter(id__in=note_ids)
+        .only("user", "status", "scheduled_time", "created_at", "next_attempt_at")
+        .order_by(),
+    )
+    index_notes_on_commit(replayed)
+    queue_publish(replayed)
+    logger.info("Replayed %s dead-lettered notes", len(replayed))
+    return len(replayed)
+
+
+def resolve_publish_intents(intents, *, posted):
+    """
+    Settle pending intents once the platform was checked by hand.
+
+    With `posted` the ID on the intent is stored instead of posting again.
+    """
+    intents = intents.filter(state="pending")
+    if posted:
+        intents = intents.exclude(platform_id="")
+    note_ids = list(intents.values_list("note_id", flat=True))
+    if posted:
+        resolved = intents.update(state="published", updated_at=timezone.now())
+    else:
+        resolved, _ = intents.delete()
+    replay_dead_letters(Note.objects.filter(id__in=note_ids, error_kind="in_doubt"))
+    return resolved
+
+
+def _claimed_notes(note_ids, claimed_by, **filters):
+    """The notes of `note_ids` still claimed by `claimed_by`, lease renewed."""
+    claimed = Note.objects.filter(id__in=note_ids, claimed_by=claimed_by)
+    claimed.update(
+        claimed_until=timezone.now() + timedelta(seconds=settings.PUBLISH_CLAIM_LEASE),
+    )
+    return list(
+        claimed.filter(**filters)
+        .select_related("user__twitter_credentials", "user__nostr_credentials")
+        .order_by(),
+    )
 
-    return published_count
 
+def _outcome(note, platform, error="", kind="", deferred_until=None):
+    """What happened to a note on one platform; `kind` is empty on success."""
+    return {
+        "note_id": note.id,
+        "platform": platform,
+        "error": error,
+        "kind": kind,
+        "deferred_until": deferred_until.isoformat() if deferred_until else None,
+    }
 
-def _process_single_tweet(note, twitter_client, nostr_client_data):
-    """Process a single note for publishing to available platforms."""
-    # Check which platforms need publishing
-    needs_twitter = note.publish_to_x and not note.tweet_id
-    needs_nostr = note.publish_to_nostr and not note.nostr_id
-
-    # Track results
-    twitter_success = bool(note.tweet_id)  # Already published?
-    nostr_success = bool(note.nostr_id)  # Already published?
-    twitter_id = note.tweet_id
-    nostr_id = note.nostr_id
-
-    # If nothing to do, return early
-    if not needs_twitter and not needs_nostr:
-        return {"all_completed": True, "twitter_id": twitter_id, "nostr_id": nostr_id}
-
-    # Try to publish to Twitter if needed
-    if needs_twitter and twitter_client:
-        tw_success, tw_id = _publish_note_to_twitter(note, twitter_client)
-        if tw_success:
-            # Update note immediately to prevent duplicate publishing
-            note.tweet_id = tw_id
-            note.save(update_fields=["tweet_id"])
-            twitter_success = True
-            twitter_id = tw_id
+
+@shared_task
+def publish_notes_to_twitter(user_id, note_ids, claimed_by, queued_at=None):
+    """Publish claimed notes of a user to Twitter, on the publish.twitter queue."""
+    claimed_at = timezone.now()
+    notes = _claimed_notes(note_ids, claimed_by, publish_to_x=True, tweet_id="")
+    if not notes:
+        return []
+
+    try:
+        twitter_client = get_twitter_client(notes[0].user.twitter_credentials)
+    except TwitterCredentials.DoesNotExist:
+        logger.warning(
+            "Notes of user %s not published to Twitter: No Twitter credentials",
+            user_id,
+        )
+        error = "User does not have Twitter API credentials configured"
+        return [_outcome(note, "twitter", error, "credentials") for note in notes]
+
+    account = twitter_account_id(notes[0].user.twitter_credentials)
+    intents = dict(
+        PublishIntent.objects.filter(note__in=notes, platform="twitter").values_list(
+            "note_id", "platform_id"
+        )
+    )
+    previous = _previous_deliveries(notes, "twitter")
+    outcomes = []
+    deliveries = []
+    for note in notes:
+        if note.id in intents:
+            outcomes.append(_reconcile_twitter_intent(note, intents[note.id]))
+            continue
+        started = time.monotonic()
+        attempt = _new_attempt(note, "twitter", queued_at, claimed_at)
+        with span("publish.twitter", note.trace_context, note_id=note.id):
+            success, result, kind = _tweet_note(
+                note, twitter_client, claimed_by, attempt
+            )
+        _log_attempt(attempt, kind)
+        deferred_until = (
+            _rate_limit_reset(note.user_id) if kind == "rate_limited" else None
+        )
+        if success:
+            _record_published(note, "twitter", result)
             logger.info(
-                "Note %s successfully published to Twitter with ID %s", note.id, tw_id
+                "Note %s successfully published to Twitter with ID %s",
+                note.id,
+                result,
             )
+            outcomes.append(_outcome(note, "twitter"))
+        elif deferred_until:
+            # Not a failure: wait for the quota to refill without an attempt
+            logger.info("Note %s deferred until the Twitter rate limit resets", note.id)
+            outcomes.append(_outcome(note, "twitter", result, kind, deferred_until))
+            continue
         else:
-            logger.error("Failed to publish note %s to Twitter", note.id)
-    elif needs_twitter and not twitter_client:
-        _update_tweet_error(
-            note, "User does not have Twitter API credentials configured"
+            logger.error("Failed to publish note %s to Twitter (%s)", note.id, kind)
+            # A rate limit without a known reset is retried like any other error
+            kind = "transient" if kind == "rate_limited" else kind
+            outcomes.append(_outcome(note, "twitter", result, kind))
+        deliveries.append(
+            _delivery(
+                note,
+                "twitter",
+                account,
+                previous,
+                {
+                    "accepted": success,
+                    "remote_id": result,
+                    "message": result,
+                    "elapsed": time.monotonic() - started,
+                },
+            ),
         )
-        logger.error(
-            "Note %s not published to Twitter: No Twitter credentials", note.id
+    _save_deliveries(deliveries)
+    get_publish_attempt_log().flush()
+    return outcomes
+
+
+def _tweet_note(note, client, claimed_by, attempt):
+    """
+    Post a note to Twitter once, behind a publish intent.
+
+    The intent stays pending when the tweet may exist despite the error.
+    """
+    if acquire_tweet_quota(note.user_id) is not None:
+        return False, "Twitter rate limit reached", "rate_limited"
+
+    # Escribir la intención antes de llamar a la API: si el worker muere
+    # a mitad, el próximo intento sabe que el tweet pudo publicarse
+    intent = PublishIntent.objects.create(
+        note=note,
+        platform="twitter",
+        claimed_by=claimed_by,
+    )
+    success, result, kind = _publish_note_to_twitter(note, client, attempt)
+    if success:
+        PublishIntent.objects.filter(id=intent.id).update(
+            state="published",
+            platform_id=result,
+            updated_at=timezone.now(),
         )
+    elif kind != "transient" or attempt.sent_at is None:
+        # Twitter refused the post or never got it: nothing was posted
+        PublishIntent.objects.filter(id=intent.id).delete()
+    return success, result, kind
 
-    # Check again if we need to publish to Nostr (get fresh data)
-    note.refresh_from_db()
-    if note.publish_to_nostr and not note.nostr_id and nostr_client_data:
-        ns_success, ns_id = _publish_note_to_nostr(note, nostr_client_data)
-        if ns_success:
-            # Update note immediately to prevent duplicate publishing
-            note.nostr_id = ns_id
-            note.save(update_fields=["nostr_id"])
-            nostr_success = True
-            nostr_id = ns_id
-            logger.info(
-                "Note %s successfully published to Nostr with ID %s", note.id, ns_id
+
+def _reconcile_twitter_intent(note, platform_id):
+    """Settle a note whose last attempt died after writing its intent."""
+    if platform_id:
+        _record_published(note, "twitter", platform_id)
+        logger.info("Note %s reconciled with tweet %s", note.id, platform_id)
+        return _outcome(note, "twitter")
+    logger.error("Note %s may already be on Twitter, not posting it again", note.id)
+    return _outcome(note, "twitter", IN_DOUBT_ERROR, "in_doubt")
+
+
+@shared_task
+def publish_notes_to_nostr(user_id, note_ids, claimed_by, queued_at=None):
+    """Publish claimed notes of a user to Nostr, on the publish.nostr queue."""
+    claimed_at = timezone.now()
+    notes = _claimed_notes(note_ids, claimed_by, publish_to_nostr=True, nostr_id="")
+    if not notes:
+        return []
+
+    decode_started = time.time()
+    nostr_client_data = _nostr_client_data(notes[0].user)
+    if nostr_client_data is None:
+        logger.warning(
+            "Notes of user %s not published to Nostr: No Nostr credentials", user_id
+        )
+        error = "User does not have Nostr credentials configured"
+        return [_outcome(note, "nostr", error, "credentials") for note in notes]
+    record_note_spans("nostr.key_decode", notes, decode_started, time.time())
+
+    relays = _nostr_targets(nostr_client_data)
+    previous = _previous_deliveries(notes, "nostr")
+    outcomes = []
+    deliveries = []
+    try:
+        # Firmar todos los eventos de Nostr antes de empezar a publicar
+        signing_started = time.time()
+        nostr_events = _sign_nostr_events(notes, nostr_client_data)
+        signed_at = timezone.now()
+        record_note_spans("nostr.sign", notes, signing_started, signed_at.timestamp())
+        for note in notes:
+            # A relay that took the event on an earlier attempt is not sent it again
+            pending = [
+                url
+                for url in relays
+                if previous.get((note.id, url), ("", 0))[0] != "delivered"
+            ]
+            attempt = _new_attempt(note, "nostr", queued_at, claimed_at, signed_at)
+            with span("publish.nostr", note.trace_context, note_id=note.id):
+                success, result, relay_results = _publish_note_to_nostr(
+                    note, nostr_client_data, nostr_events.get(note.id), pending, attempt
+                )
+            _log_attempt(attempt, "" if success else "transient")
+            deliveries += _relay_deliveries(
+                note, result, relay_results, previous, retry=success
             )
-        else:
-            logger.error("Failed to publish note %s to Nostr", note.id)
-    elif needs_nostr and not nostr_client_data:
-        _update_tweet_error(note, "User does not have Nostr credentials configured")
-        logger.error("Note %s not published to Nostr: No Nostr credentials", note.id)
-
-    # Update the overall status based on publishing results
-    _update_note_final_status(
-        note, needs_twitter, needs_nostr, twitter_success, nostr_success
+            if success:
+                _record_published(note, "nostr", result)
+                outcomes.append(_outcome(note, "nostr"))
+            else:
+                logger.error("Failed to publish note %s to Nostr", note.id)
+                # Relays come and go: a refused event may be accepted later
+                outcomes.append(_outcome(note, "nostr", result, "transient"))
+    finally:
+        _save_deliveries(deliveries)
+        get_relay_health().flush()
+        get_publish_attempt_log().flush()
+    return outcomes
+
+
+@shared_task
+def retry_relay_deliveries():
+    """Periodic task sending Nostr events again to the relays that missed them."""
+    now = timezone.now()
+    due = (
+        NoteDelivery.objects.exclude(status="delivered")
+        .filter(platform="nostr", next_attempt_at__lte=now)
+        .order_by("next_attempt_at")
+        .values_list("id", flat=True)[: settings.PUBLISH_SWEEP_PAGE_SIZE]
+    )
+    delivery_ids = list(due)
+    if not delivery_ids:
+        return "There are no relay deliveries to retry."
+    NoteDelivery.objects.filter(id__in=delivery_ids).update(
+        next_attempt_at=now + timedelta(seconds=settings.PUBLISH_CLAIM_LEASE),
     )
 
-    # Determine if all required platforms were published to
-    all_completed = (not needs_twitter or twitter_success) and (
-        not needs_nostr or nostr_success
+    by_note: dict[Note, list[str]] = {}
+    for delivery in NoteDelivery.objects.filter(id__in=delivery_ids).select_related(
+        "note__user__nostr_credentials"
+    ):
+        by_note.setdefault(delivery.note, []).append(delivery.target)
+
+    deliveries = []
+    try:
+        for user, user_notes in itertools.groupby(
+            sorted(by_note, key=operator.attrgetter("user_id")),
+            key=operator.attrgetter("user"),
+        ):
+            deliveries += _retry_user_relays(user, list(user_notes), by_note)
+    finally:
+        _save_deliveries(deliveries)
+        get_relay_health().flush()
+        get_publish_attempt_log().flush()
+    return f"Retried {len(deliveries)} relay deliveries"
+
+
+def _retry_user_relays(user, notes, relays_by_note):
+    """Send the events of one user's notes to the relays that missed them."""
+    nostr_client_data = _nostr_client_data(user)
+    if nostr_client_data is None:
+        # The relays are retried once the user has usable keys again
+        return []
+    claimed_at = timezone.now()
+    previous = _previous_deliveries(notes, "nostr")
+    nostr_events = _sign_nostr_events(notes, nostr_client_data)
+    signed_at = timezone.now()
+    deliveries = []
+    for note in notes:
+        attempt = _new_attempt(note, "nostr", None, claimed_at, signed_at)
+        with span("retry.nostr", note.trace_context, note_id=note.id):
+            success, result, relay_results = _publish_note_to_nostr(
+                note,
+                nostr_client_data,
+                nostr_events.get(note.id),
+                relays_by_note[note],
+                attempt,
+            )
+        _log_attempt(attempt, "" if success else "transient")
+        deliveries += _relay_deliveries(
+            note, result, relay_results, previous, retry=True
+        )
+    return deliveries
+
+
+def _new_attempt(note, platform, queued_at, claimed_at, signed_at=None):
+    """A publish attempt of `note`, to be completed by the platform call."""
+    return PublishAttempt(
+        note=note,
+        platform=platform,
+        queued_at=datetime.fromisoformat(queued_at) if queued_at else None,
+        claimed_at=claimed_at,
+        signed_at=signed_at,
     )
 
+
+def _log_attempt(attempt, kind):
+    """Add a finished attempt to the log, given its kind of error, if any."""
+    attempt.error_kind = kind or ""
+    if not kind:
+        attempt.outcome = "published"
+    elif kind == "rate_limited" and attempt.sent_at is None:
+        attempt.outcome = "deferred"
+    else:
+        attempt.outcome = "failed"
+    get_publish_attempt_log().add(attempt)
+
+
+def _nostr_targets(client_data):
+    """The user's relays followed by the default relays, without repeats."""
+    return list(dict.fromkeys([*client_data["relays"], *settings.NOSTR_DEFAULT_RELAYS]))
+
+
+def _previous_deliveries(notes, platform):
+    """(status, attempts) of the earlier deliveries of `notes`, by note and target."""
     return {
-        "all_completed": all_completed,
-        "twitter_id": twitter_id,
-        "nostr_id": nostr_id,
+        (note_id, target): (status, attempts)
+        for note_id, target, status, attempts in NoteDelivery.objects.filter(
+            note__in=notes,
+            platform=platform,
+        ).values_list("note_id", "target", "status", "attempts")
     }
 
 
-def _update_note_final_status(
-    note, needs_twitter, needs_nostr, twitter_success, nostr_success
-):
-    """Update the final status of the note based on publishing results."""
-    # Refresh to get the most current state
-    note.refresh_from_db()
-
-    # Determine the appropriate status
-    if needs_twitter and needs_nostr:
-        if twitter_success and nostr_success:
-            note.status = "published"
-            note.published_at = timezone.now()
-            note.last_error = ""
-        elif twitter_success:
-            note.status = "published_x"
-            note.last_error = "Published to X/Twitter but failed to publish to Nostr"
-        elif nostr_success:
-            note.status = "published_n"
-            note.last_error = "Published to Nostr but failed to publish to X/Twitter"
-    elif (needs_twitter and twitter_success) or (needs_nostr and nostr_success):
-        note.status = "published"
-        note.published_at = timezone.now()
-        note.last_error = ""
-
-    # Save the updated note
-    note.save()
-
-
-def _log_successful_publish(note, twitter_id, nostr_id):
-    """Log successful publishing of a note."""
-    platforms = []
-    if twitter_id:
-        platforms.append("Twitter")
-    if nostr_id:
-        platforms.append("Nostr")
-    platform_str = " and ".join(platforms)
-    logger.info("Note %s successfully published to %s", note.id, platform_str)
+def _delivery(note, platform, target, previous, result):
+    """The delivery of `note` to `target`, from a publish_event style result."""
+    _, attempts = previous.get((note.id, target), ("", 0))
+    delivered = result["accepted"]
+    return NoteDelivery(
+        note=note,
+        platform=platform,
+        target=target,
+        status="delivered" if delivered else "failed",
+        attempts=attempts + 1,
+        latency=result["elapsed"],
+        remote_id=result["remote_id"] if delivered else "",
+        last_error="" if delivered else result["message"],
+        delivered_at=timezone.now() if delivered else None,
+    )
 
 
-def _publish_note_to_twitter(note, client):
-    """Attempt to publish a note to Twitter with retries."""
-    # Double-check if already published to Twitter
-    if note.tweet_id:
-        logger.info(
-            "Note %s already published to Twitter (ID: %s), skipping",
-            note.id,
-            note.tweet_id,
+def _relay_deliveries(note, event_id, relay_results, previous, *, retry):
+    """The deliveries of a note's event to the relays in `relay_results`."""
+    policy = settings.PUBLISH_RETRY_POLICY["nostr"]
+    deliveries = []
+    for url, result in relay_results.items():
+        delivery = _delivery(
+            note, "nostr", url, previous, {**result, "remote_id": event_id}
         )
-        return True, note.tweet_id
-
-    retries = 0
-    success = False
-    tweet_id = ""
-
-    while retries < MAX_RETRIES and not success:
-        try:
-            response = client.create_tweet(text=note.content)
-            tweet_id = response.data["id"]
-            success = True
-
-        except tweepy.errors.TweepyException as e:
-            _handle_api_error(note, str(e), retries, "Twitter")
-            retries += 1
-
-        except Exception as e:
-            error_msg = f"Twitter error: {e!s}"
-            _update_tweet_error(note, error_msg)
-            logger.exception(
-                "Unexpected error when posting note %s to Twitter", note.id
+        if (
+            retry
+            and not result["accepted"]
+            and delivery.attempts < policy["max_attempts"]
+        ):
+            delivery.next_attempt_at = timezone.now() + timedelta(
+                seconds=_retry_delay(policy, delivery.attempts),
             )
-            break
+        deliveries.append(delivery)
+    return deliveries
+
+
+def _save_deliveries(deliveries):
+    """Insert or update deliveries with a single query."""
+    if not deliveries:
+        return
+    NoteDelivery.objects.bulk_create(
+        deliveries,
+        update_conflicts=True,
+        unique_fields=["note", "platform", "target"],
+        update_fields=[
+            "status",
+            "attempts",
+            "next_attempt_at",
+            "latency",
+            "remote_id",
+            "last_error",
+            "delivered_at",
+            "updated_at",
+        ],
+    )
 
-    if not success:
-        logger.error(
-            "Could not post note %s to Twitter after %s attempts.",
-            note.id,
-            MAX_RETRIES,
+
+def _nostr_client_data(user):
+    """The decoded keys and relays of a user, or None without usable ones."""
+    try:
+        nostr_credentials = user.nostr_credentials
+    except NostrCredentials.DoesNotExist:
+        logger.info("User %s does not have Nostr credentials configured.", user.id)
+        return None
+    if not nostr_credentials.private_key:
+        logger.warning(
+            "User %s has incomplete Nostr credentials (missing private key or relays)",
+            user.id,
         )
+        return None
+    try:
+        private_key, public_key = get_nostr_keys(nostr_credentials)
+    except ValueError:
+        logger.exception("User %s has an invalid Nostr private key", user.id)
+        return None
+    return {
+        "private_key": private_key,
+        "public_key": public_key,
+        "relays": nostr_credentials.get_relay_list(),
+    }
 
-    return success, tweet_id
 
+def _sign_nostr_events(notes, nostr_client_data):
+    """Sign the Nostr events of a batch at once, by note id, before sending."""
+    if not nostr_client_data:
+        return {}
+    events = {
+        note.id: _build_nostr_event(note, nostr_client_data["public_key"])
+        for note in notes
+        if note.publish_to_nostr
+    }
+    try:
+        sign_events(nostr_client_data["private_key"], list(events.values()))
+    except Exception:
+        # Each note signs its own event when it is published
+        logger.exception("Error signing Nostr events")
+        return {}
+    return events
 
-def _publish_note_to_nostr(note, client_data):
-    """Attempt to publish a note to Nostr with retries."""
-    # Double-check if already published to Nostr
-    if note.nostr_id:
-        logger.info(
-            "Note %s already published to Nostr (ID: %s), skipping",
-            note.id,
-            note.nostr_id,
-        )
-        return True, note.nostr_id
 
-    consistent_timestamp = (
-        int(note.scheduled_time.timestamp())
-        if note.scheduled_time
-        else int(note.created_at.timestamp())
+# The id field of each platform and the condition under which the note is
+# done everywhere else
+_PLATFORM_FIELDS = {
+    "twitter": ("tweet_id", Q(publish_to_nostr=False) | ~Q(nostr_id="")),
+    "nostr": ("nostr_id", Q(publish_to_x=False) | ~Q(tweet_id="")),
+}
+
+
+def _record_published(note, platform, platform_id):
+    """
+    Store the id a note was published with on `platform`, with one UPDATE.
+
+    The database works out the status, so platform tasks finish in any order.
+    """
+    id_field, done_elsewhere = _PLATFORM_FIELDS[platform]
+    Note.objects.filter(id=note.id, **{id_field: ""}).update(
+        **{id_field: platform_id},
+        status=Case(
+            When(done_elsewhere, then=Value("published")), default=Value("partial")
+        ),
+        published_at=Case(
+            When(done_elsewhere, then=Value(timezone.now())),
+            default=F("published_at"),
+        ),
+        version=F("version") + 1,
     )
+    observe_publish_lag(note, platform)
 
-    retries = 0
-    success = False
-    note_id = ""
-
-    while retries < MAX_RETRIES and not success:
-        # Intentamos una sola vez la publicación - si falla por completo, pasamos a los retries
-        try:
-            # Crear un evento con timestamp consistente
-            private_key = nk.PrivateKey.from_nsec(client_data["private_key"])
-
-            # Crear un evento con ID consistente
-            event = Event(
-                content=note.content,
-                public_key=private_key.public_key.hex(),
-                kind=1,  # Regular note
-                tags=[],  # No tags for simple notes
-                created_at=consistent_timestamp,  # Timestamp consistente
-            )
 
-            # Firmar el evento para finalizar su ID
-            private_key.sign_event(event)
-            note_id = event.id
+@shared_task
+def finish_user_notes(results, user_id, note_ids, claimed_by):
+    """Settle a batch once its platform tasks are done."""
+    outcomes: dict[int, list[dict]] = {}
+    for outcome in itertools.chain.from_iterable(results):
+        outcomes.setdefault(outcome["note_id"], []).append(outcome)
 
-            # Guardar el ID inmediatamente para evitar duplicados en caso de reintento
-            note.nostr_id = note_id
-            note.save(update_fields=["nostr_id"])
+    published_count = 0
+    for note in Note.objects.filter(id__in=note_ids, claimed_by=claimed_by).order_by():
+        status = _apply_publish_result(note, outcomes.get(note.id, []))
+        if status == "published":
+            published_count += 1
+            _log_successful_publish(note)
 
-            # Ahora publicamos a los relays, incluso si falla esto, ya tenemos el ID
-            success = _publish_to_relays(client_data["relays"], event)
+    # Retried notes come due at a new time, finished ones leave the index
+    reindex_notes(note_ids)
+    logger.info("Se publicaron %s tweets", published_count)
+    return published_count
 
-            if success:
-                logger.info(
-                    "Note %s successfully published to Nostr with ID %s",
-                    note.id,
-                    note_id,
-                )
 
-        except Exception:
-            logger.exception("Error creating Nostr event for note %s", note.id)
-            _update_tweet_error(note, "Nostr error")
-            success = False
-            retries += 1
+def _apply_publish_result(note, outcomes):
+    """Write the outcome of a pass with one UPDATE, unless the note changed."""
+    status = note.status
+    failures = {
+        outcome["platform"]: outcome["kind"]
+        for outcome in outcomes
+        if outcome["kind"] in RETRYABLE_ERROR_KINDS + FINAL_ERROR_KINDS
+    }
+    deferred_until = max(
+        (
+            datetime.fromisoformat(outcome["deferred_until"])
+            for outcome in outcomes
+            if outcome["deferred_until"]
+        ),
+        default=None,
+    )
+    changes: dict[str, typing.Any] = {
+        "last_error": "; ".join(
+            outcome["error"] for outcome in outcomes if outcome["error"]
+        ),
+        "error_kind": "",
+        "claimed_by": "",
+        "claimed_until": None,
+        "version": F("version") + 1,
+    }
+    if not note.publish_to_x and not note.publish_to_nostr:
+        changes.update(
+            status="dead_letter",
+            error_kind="permanent",
+            last_error="No platform selected for this note",
+        )
+    elif failures and status != "published":
+        changes.update(_failure_changes(note, failures))
+    elif deferred_until:
+        changes["error_kind"] = "rate_limited"
+    status = changes.get("status", status)
+    if deferred_until and status != "dead_letter":
+        changes["next_attempt_at"] = max(
+            changes.get("next_attempt_at") or deferred_until,
+            deferred_until,
+        )
+
+    updated = Note.objects.filter(id=note.id, version=note.version).update(**changes)
+    if not updated:
+        logger.warning("Note %s was modified while it was being published", note.id)
+        _release_notes([note])
+    return status
 
-    if not success:
+
+def _failure_changes(note, failures):
+    """Fields of a note that failed on some platforms, by kind of error."""
+    final = [
+        platform for platform, kind in failures.items() if kind in FINAL_ERROR_KINDS
+    ]
+    if final:
         logger.error(
-            "Could not post note %s to Twitter after %s attempts.",
+            "Could not publish note %s to %s, moved to the dead letters.",
             note.id,
-            MAX_RETRIES,
+            " and ".join(final),
         )
+        DEAD_LETTERS.labels(failures[final[0]]).inc()
+        return {
+            "status": "dead_letter",
+            "error_kind": failures[final[0]],
+            "next_attempt_at": None,
+        }
+    return {"error_kind": "transient", **_retry_changes(note, list(failures))}
 
-    return success, note_id
 
+def _log_successful_publish(note):
+    """Log successful publishing of a note."""
+    platforms = []
+    if note.tweet_id:
+        platforms.append("Twitter")
+    if note.nostr_id:
+        platforms.append("Nostr")
+    platform_str = " and ".join(platforms)
+    logger.info(
+        "Note %s successfully published to %s, %.1f s after its scheduled time",
+        note.id,
+        platform_str,
+        (note.published_at - (note.scheduled_time or note.created_at)).total_seconds(),
+    )
 
-def _publish_to_relays(relays, event):
-    """Publish an event to the given relays."""
+
+def _publish_note_to_twitter(note, client, attempt):
+    """
+    Post a note to Twitter once, writing the call to `attempt`.
+
+    Returns (success, tweet id or error message, kind of error).
+    """
+    attempt.sent_at = timezone.now()
     try:
-        # Create a relay manager
-        relay_manager = RelayManager()
-
-        # Add all the relays
-        for relay_url in relays:
-            relay_manager.add_relay(relay_url)
-            logger.debug("Added relay: %s", relay_url)
-
-        relay_manager.add_relay("wss://nostr-pub.wellorder.net")
-        relay_manager.add_relay("wss://relay.damus.io")
-        relay_manager.add_relay("wss://relay.snort.social")
-        relay_manager.add_relay("wss://relay.primal.net")
-
-        # Connect to all relays
-        relay_manager.open_connections(
-            {
-                "cert_reqs": ssl.CERT_NONE
-            }  # NOTE: This disables ssl certificate verification
+        with span("twitter.post"):
+            response = client.create_tweet(text=note.content)
+    except tweepy.errors.HTTPException as e:
+        attempt.acked_at = timezone.now()
+        attempt.error_class = type(e).__name__
+        attempt.http_status = e.response.status_code
+        TWITTER_CALL_SECONDS.observe(
+            (attempt.acked_at - attempt.sent_at).total_seconds()
         )
-        time.sleep(1.5)  # Give time for connections to establish
+        exhausted = isinstance(e, tweepy.errors.TooManyRequests)
+        record_rate_limit(note.user_id, e.response, exhausted=exhausted)
+        logger.warning("Error publishing note %s to Twitter: %s", note.id, e)
+        if exhausted:
+            return False, "Twitter rate limit reached", "rate_limited"
+        return False, f"Twitter error: {e!s}", classify_twitter_error(e)
+    except tweepy.errors.TweepyException as e:
+        attempt.error_class = type(e).__name__
+        logger.warning("Error publishing note %s to Twitter: %s", note.id, e)
+        return False, f"Twitter error: {e!s}", classify_twitter_error(e)
+    except Exception as e:
+        attempt.error_class = type(e).__name__
+        if not twitter_request_sent(e):
+            attempt.sent_at = None
+        logger.exception("Unexpected error when posting note %s to Twitter", note.id)
+        return False, f"Twitter error: {e!s}", "transient"
+
+    attempt.acked_at = timezone.now()
+    attempt.http_status = response.status_code
+    TWITTER_CALL_SECONDS.observe((attempt.acked_at - attempt.sent_at).total_seconds())
+    record_rate_limit(note.user_id, response)
+    return True, response.json()["data"]["id"], None
+
+
+def _rate_limit_reset(user_id):
+    """When the account's exhausted Twitter quota refills."""
+    quota = get_twitter_quota(user_id)
+    reset = quota["reset"] if quota else None
+    return datetime.fromtimestamp(reset, tz=UTC) if reset else None
+
+
+def _build_nostr_event(note, public_key):
+    """Return the unsigned Nostr event of a note."""
+    consistent_timestamp = (
+        int(note.scheduled_time.timestamp())
+        if note.scheduled_time
+        else int(note.created_at.timestamp())
+    )
+    # Crear un evento con ID consistente: si hay que reintentar, los relays
+    # reciben el mismo evento y no lo duplican
+    return Event(
+        content=note.content,
+        public_key=public_key,
+        kind=1,  # Regular note
+        tags=[],  # No tags for simple notes
+        created_at=consistent_timestamp,  # Timestamp consistente
+    )
 
-        # Publish the event to all relays
-        relay_manager.publish_event(event)
-        time.sleep(1)  # Give time for the event to be published
 
-        # Close all relay connections
-        relay_manager.close_connections()
+def _publish_note_to_nostr(note, client_data, event, relays, attempt):
+    """
+    Send a note's signed `event` to the relays, writing it to `attempt`.
 
-    except Exception:
-        logger.exception("Error publishing to Nostr relays")
-        return False
-    else:
-        logger.info("Event %s published to all relays", event.id)
-        return True
+    Returns (success, event id or error message, relay results).
+    """
+    attempt.relay_count = len(relays)
+    try:
+        if event is None:
+            event = _build_nostr_event(note, client_data["public_key"])
+            # Firmar el evento para finalizar su ID
+            client_data["private_key"].sign_event(event)
+            attempt.signed_at = timezone.now()
+
+        attempt.sent_at = timezone.now()
+        relay_results = _publish_to_relays(relays, event)
+    except Exception as e:
+        attempt.error_class = type(e).__name__
+        logger.exception("Error creating Nostr event for note %s", note.id)
+        return False, "Nostr error", {}
+
+    attempt.acked_at = timezone.now()
+    observe_relay_results(relay_results)
+    record_relay_spans(attempt.sent_at.timestamp(), relay_results)
+    attempt.relays_accepted = sum(
+        result["accepted"] for result in relay_results.values()
+    )
+    if not attempt.relays_accepted:
+        return False, "Nostr error: no relay accepted the event", relay_results
+
+    logger.info(
+        "Note %s successfully published to Nostr with ID %s",
+        note.id,
+        event.id,
+    )
+    return True, event.id, relay_results
 
 
-def _handle_api_error(note, error_message, retry_count, platform):
-    """Handle API errors with exponential backoff."""
-    _update_tweet_error(note, f"{platform} error: {error_message}")
+def _publish_to_relays(relays, event):
+    """Publish an event to the given relays."""
+    results = publish_event(relays, event)
+    accepted = [url for url, result in results.items() if result["accepted"]]
+    logger.info(
+        "Event %s accepted by %s of %s relays", event.id, len(accepted), len(results)
+    )
+    return results
 
-    # Calculate backoff time with exponential increase
-    backoff_time = BACKOFF_BASE * (2**retry_count)
+
+def _retry_changes(note, platforms):
+    """Fields that defer the next attempt of a note that failed on `platforms`."""
+    policies = [settings.PUBLISH_RETRY_POLICY[platform] for platform in platforms]
+    attempts = note.attempts + 1
+
+    if attempts >= min(policy["max_attempts"] for policy in policies):
+        logger.error(
+            "Could not publish note %s to %s after %s attempts.",
+            note.id,
+            " and ".join(platforms),
+            attempts,
+        )
+        DEAD_LETTERS.labels("transient").inc()
+        return {
+            "attempts": attempts,
+            "next_attempt_at": None,
+            "status": "dead_letter",
+        }
+
+    delay = max(_retry_delay(policy, attempts) for policy in policies)
+    for platform in platforms:
+        PUBLISH_RETRIES.labels(platform).inc()
     logger.warning(
-        "Error publishing note %s to %s (attempt %s): %s. Retrying in %s seconds.",
+        "Error publishing note %s to %s (attempt %s). Retrying in %.0f seconds.",
         note.id,
-        platform,
-        retry_count + 1,
-        error_message,
-        backoff_time,
+        " and ".join(platforms),
+        attempts,
+        delay,
     )
-
-    # Sleep for the calculated backoff time
-    time.sleep(backoff_time)
+    return {
+        "attempts": attempts,
+        "next_attempt_at": timezone.now() + timedelta(seconds=delay),
+    }
 
 
-def _update_tweet_error(note, error_message):
-    """Update the note with the error message."""
-    note.last_error = error_message
-    note.save(update_fields=["last_error"])
+def _retry_delay(policy, attempts):
+    """Exponential backoff with random jitter, in seconds."""
+    jitter = random.uniform(0, policy["jitter"])  # noqa: S311
+    return policy["backoff_base"] * 2 ** (attempts - 1) + jitter
 
 
-def _mark_tweets_with_error(tweets, error_message):
-    """Mark multiple tweets with the same error message."""
-    for note in tweets:
-        note.status = "error"
-        note.last_error = error_message
-        note.save(update_fields=["status", "last_error"])
+def _mark_tweets_with_error(tweets, error_message, error_kind):
+    """Move multiple tweets to the dead letters with the same error."""
+    Note.objects.filter(id__in=[note.id for note in tweets]).update(
+        status="dead_letter",
+        last_error=error_message,
+        error_kind=error_kind,
+        claimed_by="",
+        claimed_until=None,
+        version=F("version") + 1,
+    )
 
 
 @shared_task
@@ -460,4 +1157,48 @@ def schedule_pending_tweets():
     """
     Periodic task to check and publish scheduled tweets
     """
-    return publish_tweet.delay()
+    if _sweep_lock().locked():
+        # Leave the due notes in the index for the next run
+        _record_skipped_sweep()
+        return SWEEP_SKIPPED
+
+    if not settings.PUBLISH_DUE_INDEX:
+        _record_due_backlog_from_database()
+        return publish_tweet.delay()
+
+    try:
+        record_due_backlog(*due_backlog())
+        note_ids = pop_due_note_ids()
+    except redis.RedisError:
+        logger.exception("Could not read the due index, checking every note")
+        return publish_tweet.delay()
+
+    if not note_ids:
+        return "There are no tweets pending to be published."
+    return publish_tweet.delay(note_ids)
+
+
+def _record_due_backlog_from_database():
+    """Record the due backlog for the metrics, with one aggregate query."""
+    backlog = _due_notes().aggregate(
+        size=Count("id"),
+        oldest_due_at=Min(Coalesce("scheduled_time", "created_at")),
+    )
+    oldest_due_at = backlog["oldest_due_at"]
+    record_due_backlog(
+        backlog["size"],
+        oldest_due_at.timestamp() if oldest_due_at else None,
+    )
+
+
+@shared_task
+def prune_publish_attempts():
+    """Periodic task deleting publish attempts past PUBLISH_ATTEMPT_RETENTION days."""
+    cutoff = timezone.now() - timedelta(days=settings.PUBLISH_ATTEMPT_RETENTION)
+    old_attempts = PublishAttempt.objects.filter(created_at__lt=cutoff).order_by()
+    pruned = 0
+    while attempt_ids := list(
+        old_attempts.values_list("id", flat=True)[:PRUNE_CHUNK_SIZE],
+    ):
+        pruned += PublishAttempt.objects.filter(id__in=attempt_ids).delete()[0]
+    return f"Pruned {pruned} publish attempts"
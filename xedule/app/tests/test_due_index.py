@@ -0,0 +1,150 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django_celery_beat.models import PeriodicTask
+
+from xedule.app.due_index import DUE_INDEX_KEY
+from xedule.app.due_index import index_notes
+from xedule.app.metrics import DUE_BACKLOG_KEY
+from xedule.app.signals import create_periodic_tasks
+from xedule.app.tasks import publish_tweet
+from xedule.app.tasks import schedule_pending_tweets
+from xedule.app.tests.factories import NoteFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def redis_client(settings):
+    settings.PUBLISH_DUE_INDEX = True
+    client = mock.MagicMock()
+    # Nothing due in the backlog
+    client.pipeline.return_value.execute.return_value = [0, []]
+    with mock.patch("xedule.app.due_index.get_redis", return_value=client):
+        yield client
+
+
+def _indexed(redis_client):
+    """Scores written to the index, by note id."""
+    pipeline = redis_client.pipeline.return_value
+    return {
+        note_id: score
+        for call in pipeline.zadd.call_args_list
+        for note_id, score in call.args[1].items()
+    }
+
+
+class TestIndexNotes:
+    def test_due_notes_are_scored_by_scheduled_time(self, redis_client):
+        note = NoteFactory.create()
+
+        index_notes([note])
+
+        assert note.scheduled_time is not None
+        assert _indexed(redis_client) == {note.id: note.scheduled_time.timestamp()}
+
+    def test_retries_are_scored_by_next_attempt(self, redis_client):
+        next_attempt_at = timezone.now() + timedelta(minutes=5)
+        note = NoteFactory.create(next_attempt_at=next_attempt_at)
+
+        index_notes([note])
+
+        assert _indexed(redis_client) == {note.id: next_attempt_at.timestamp()}
+
+    def test_unscheduled_notes_are_due_from_creation(self, redis_client):
+        note = NoteFactory.create(scheduled_time=None)
+
+        index_notes([note])
+
+        assert _indexed(redis_client) == {note.id: note.created_at.timestamp()}
+
+    def test_finished_notes_leave_the_index(self, redis_client):
+        note = NoteFactory.create(status="published")
+
+        index_notes([note])
+
+        pipeline = redis_client.pipeline.return_value
+        pipeline.zrem.assert_called_once_with(DUE_INDEX_KEY, note.id)
+        assert _indexed(redis_client) == {}
+
+    def test_saved_note_is_indexed_on_commit(
+        self,
+        redis_client,
+        django_capture_on_commit_callbacks,
+    ):
+        with (
+            mock.patch("xedule.app.tasks.publish_user_notes.apply_async"),
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            note = NoteFactory.create()
+
+        assert note.id in _indexed(redis_client)
+
+
+class TestScheduling:
+    def test_empty_tick_does_not_touch_the_database(
+        self,
+        redis_client,
+        django_assert_num_queries,
+    ):
+        redis_client.eval.return_value = []
+
+        with django_assert_num_queries(0):
+            result = schedule_pending_tweets()
+
+        assert result == "There are no tweets pending to be published."
+        redis_client.eval.assert_called_once()
+
+    def test_due_notes_are_dispatched(self, redis_client):
+        redis_client.eval.return_value = [b"7", b"8"]
+
+        with mock.patch("xedule.app.tasks.publish_tweet.delay") as delay:
+            schedule_pending_tweets()
+
+        delay.assert_called_once_with([7, 8])
+
+    def test_backlog_is_read_from_the_index(self, redis_client):
+        redis_client.pipeline.return_value.execute.return_value = [2, [(b"7", 60.0)]]
+        redis_client.eval.return_value = []
+
+        schedule_pending_tweets()
+
+        assert cache.get(DUE_BACKLOG_KEY) == {"size": 2, "oldest_due_at": 60.0}
+
+    def test_notes_not_due_are_reindexed(self, redis_client):
+        scheduled_time = timezone.now() + timedelta(hours=1)
+        note = NoteFactory.create(scheduled_time=scheduled_time)
+
+        result = publish_tweet([note.id])
+
+        assert result == "There are no tweets pending to be published."
+        assert _indexed(redis_client) == {note.id: scheduled_time.timestamp()}
+
+    def test_database_is_swept_for_notes_missing_from_the_index(self, settings):
+        settings.PUBLISH_DUE_INDEX_SWEEP_INTERVAL = 15
+
+        create_periodic_tasks(sender=None)
+
+        sweep = PeriodicTask.objects.get(task="xedule.app.tasks.publish_tweet")
+        # Without note ids a run reads every due note from the database
+        assert sweep.args == "[]"
+        assert sweep.interval.every == 15  # noqa: PLR2004
+        assert sweep.enabled
+
+
+def test_rebuild_due_index(redis_client):
+    due = NoteFactory.create()
+    NoteFactory.create(status="published")
+
+    call_command("rebuild_due_index")
+
+    assert due.scheduled_time is not None
+    assert _indexed(redis_client) == {due.id: due.scheduled_time.timestamp()}
+    redis_client.rename.assert_called_once_with(
+        f"{DUE_INDEX_KEY}:rebuild",
+        DUE_INDEX_KEY,
+    )
@@ -0,0 +1,46 @@
+import nostr.key as nk
+
+from xedule.app.forms import NostrCredentialsForm
+
+
+class TestNostrCredentialsForm:
+    def test_keys_are_normalised_to_bech32(self):
+        private_key = nk.PrivateKey()
+
+        form = NostrCredentialsForm(
+            {
+                "private_key": private_key.hex(),
+                "public_key": private_key.public_key.hex(),
+            },
+        )
+
+        assert form.is_valid(), form.errors
+        assert form.cleaned_data["private_key"] == private_key.bech32()
+        assert form.cleaned_data["public_key"] == private_key.public_key.bech32()
+
+    def test_public_key_is_derived_when_missing(self):
+        private_key = nk.PrivateKey()
+
+        form = NostrCredentialsForm({"private_key": private_key.bech32()})
+
+        assert form.is_valid(), form.errors
+        assert form.cleaned_data["public_key"] == private_key.public_key.bech32()
+
+    def test_invalid_private_key(self):
+        form = NostrCredentialsForm({"private_key": "nsec1notakey"})
+
+        assert not form.is_valid()
+        assert list(form.errors) == ["private_key"]
+
+    def test_mismatched_public_key(self):
+        form = NostrCredentialsForm(
+            {
+                "private_key": nk.PrivateKey().bech32(),
+                "public_key": nk.PrivateKey().public_key.bech32(),
+            },
+        )
+
+        assert not form.is_valid()
+        assert form.errors["public_key"] == [
+            "This public key does not match the private key.",
+        ]
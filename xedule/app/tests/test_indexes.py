@@ -0,0 +1,99 @@
+import pytest
+from django.db import connection
+
+from xedule.app.models import Note
+from xedule.app.tasks import _after_checkpoint
+from xedule.app.tasks import _due_notes
+from xedule.app.tasks import _sweep_notes
+from xedule.users.tests.factories import UserFactory
+
+TABLE_SIZE = 1_000_000
+# One note in this many is still due, the rest are published
+DUE_EVERY = 1000
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        connection.vendor != "postgresql",
+        reason="The query plans are those of PostgreSQL",
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def large_note_table(django_db_setup, django_db_blocker):
+    """A million notes over a hundred users, nearly all of them published."""
+    with django_db_blocker.unblock():
+        users = UserFactory.create_batch(100)
+        first_user = min(user.id for user in users)
+        # Every other column is copied from a note saved by the ORM, so new
+        # columns get their default without being listed here
+        (template,) = Note.objects.bulk_create(
+            [Note(user=users[0], content="template", status="published")],
+        )
+        generated = {
+            "user_id": f"{first_user} + i %% 100",
+            "content": "'note ' || i",
+            "status": f"CASE WHEN i %% {DUE_EVERY} = 0 THEN 'pending' ELSE 'published' END",
+            "scheduled_time": "now() - i * interval '1 second'",
+            "created_at": "now() - i * interval '1 second'",
+        }
+        columns = [
+            field.column
+            for field in Note._meta.fields  # noqa: SLF001
+            if not field.primary_key
+        ]
+        values = [generated.get(column, f"template.{column}") for column in columns]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO app_note ({", ".join(columns)})
+                SELECT {", ".join(values)}
+                FROM app_note AS template, generate_series(1, %s) AS i
+                WHERE template.id = %s
+                """,  # noqa: S608
+                [TABLE_SIZE, template.id],
+            )
+            cursor.execute("ANALYZE app_note")
+
+    yield users
+
+    with django_db_blocker.unblock():
+        with connection.cursor() as cursor:
+            cursor.execute("TRUNCATE app_note CASCADE")
+        for user in users:
+            user.delete()
+
+
+def test_due_query_uses_partial_index(large_note_table):
+    plan = _due_notes().values_list("user_id", "id").explain()
+
+    assert "note_due_idx" in plan
+    assert "Sort" not in plan
+
+
+def test_sweep_page_uses_sweep_index(large_note_table):
+    user = large_note_table[50]
+    # With a thousand due notes sorting them is as cheap as reading the
+    # index in order, so rule sorts out to check the index gives the order
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_sort = off")
+        cursor.execute("SET LOCAL enable_incremental_sort = off")
+
+    plan = (
+        _sweep_notes()
+        .filter(_after_checkpoint([user.id, None, 0]))
+        .values_list("user_id", "scheduled_time", "id")[:1000]
+        .explain()
+    )
+
+    assert "note_sweep_idx" in plan
+    assert "Sort" not in plan
+
+
+def test_note_list_uses_user_index(large_note_table):
+    user = large_note_table[0]
+
+    plan = Note.objects.filter(user=user).order_by("created_at")[:20].explain()
+
+    assert "note_user_created_idx" in plan
@@ -0,0 +1,60 @@
+import time
+
+from xedule.app.locks import LeaseLock
+
+
+def test_lock_is_exclusive():
+    first = LeaseLock("test", timeout=10)
+    second = LeaseLock("test", timeout=10)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert second.locked()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+    assert not second.locked()
+
+
+def test_lease_is_renewed_while_held():
+    lock = LeaseLock("test", timeout=0.3)
+    assert lock.acquire()
+
+    time.sleep(0.6)
+
+    assert not LeaseLock("test", timeout=0.3).acquire()
+    lock.release()
+
+
+def test_lock_of_a_crashed_worker_expires(fake_redis):
+    # A worker that died while holding the lock never renews it
+    fake_redis.set("lock:test", "crashed-worker", px=300)
+
+    time.sleep(0.4)
+
+    lock = LeaseLock("test", timeout=0.3)
+    assert lock.acquire()
+    lock.release()
+
+
+def test_expired_lease_does_not_renew_the_next_holder(fake_redis):
+    lock = LeaseLock("test", timeout=0.3)
+    assert lock.acquire()
+    # The lease ran out and another run took the lock, without expiry
+    fake_redis.set("lock:test", "someone-else")
+
+    time.sleep(0.2)
+
+    assert fake_redis.pttl("lock:test") == -1
+    lock.release()
+
+
+def test_release_leaves_a_lock_taken_by_someone_else(fake_redis):
+    lock = LeaseLock("test", timeout=10)
+    assert lock.acquire()
+    fake_redis.set("lock:test", "someone-else")
+
+    lock.release()
+
+    assert fake_redis.get("lock:test") == b"someone-else"
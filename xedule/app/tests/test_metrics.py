@@ -0,0 +1,106 @@
+import time
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from prometheus_client import REGISTRY
+
+from xedule.app.metrics import DUE_BACKLOG_KEY
+from xedule.app.metrics import SKIPPED_SWEEPS_KEY
+from xedule.app.metrics import observe_relay_results
+from xedule.app.metrics import record_due_backlog
+from xedule.app.tasks import _record_published
+from xedule.app.tasks import schedule_pending_tweets
+from xedule.app.tests.factories import NoteFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_scrape_does_not_query_the_database(
+    client,
+    settings,
+    django_assert_num_queries,
+):
+    settings.METRICS_TOKEN = "secret"  # noqa: S105
+    record_due_backlog(3, time.time() - 60)
+    cache.set(SKIPPED_SWEEPS_KEY, 2)
+
+    with django_assert_num_queries(0):
+        response = client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+
+    assert response.status_code == 200  # noqa: PLR2004
+    samples = {
+        line.split()[0]: float(line.split()[1])
+        for line in response.content.decode().splitlines()
+        if not line.startswith("#")
+    }
+    assert samples["xedule_due_backlog"] == 3  # noqa: PLR2004
+    assert samples["xedule_oldest_due_note_age_seconds"] >= 60  # noqa: PLR2004
+    assert samples["xedule_publish_sweeps_skipped_total"] == 2  # noqa: PLR2004
+
+
+@pytest.mark.parametrize(
+    ("token", "authorization", "status_code"),
+    [
+        ("", "Bearer ", 404),
+        ("secret", "", 403),
+        ("secret", "Bearer wrong", 403),
+    ],
+    ids=["disabled", "no-token", "wrong-token"],
+)
+def test_scrape_needs_the_token(client, settings, token, authorization, status_code):
+    settings.METRICS_TOKEN = token
+
+    response = client.get("/metrics", HTTP_AUTHORIZATION=authorization)
+
+    assert response.status_code == status_code
+
+
+def test_periodic_task_records_the_backlog(settings):
+    settings.PUBLISH_DUE_INDEX = False
+    oldest, _ = NoteFactory.create_batch(2)
+    NoteFactory.create(status="published")
+
+    with mock.patch("xedule.app.tasks.publish_tweet.delay"):
+        schedule_pending_tweets()
+
+    assert oldest.scheduled_time is not None
+    assert cache.get(DUE_BACKLOG_KEY) == {
+        "size": 2,
+        "oldest_due_at": oldest.scheduled_time.timestamp(),
+    }
+
+
+def test_publish_lag_is_observed_per_platform():
+    note = NoteFactory.create()
+    before = _sample("xedule_publish_lag_seconds_count", platform="nostr")
+
+    _record_published(note, "nostr", "abc")
+
+    assert _sample("xedule_publish_lag_seconds_count", platform="nostr") == before + 1
+
+
+def test_relay_answers_are_counted():
+    accepted = _sample("xedule_relay_publishes_total", result="accepted")
+    rejected = _sample("xedule_relay_publishes_total", result="rejected")
+
+    observe_relay_results(
+        {
+            "wss://a": {"accepted": True, "ack_time": 0.2},
+            "wss://b": {"accepted": False, "ack_time": None},
+        },
+    )
+
+    assert _sample("xedule_relay_publishes_total", result="accepted") == accepted + 1
+    assert _sample("xedule_relay_publishes_total", result="rejected") == rejected + 1
@@ -0,0 +1,15 @@
+from unittest import mock
+
+from xedule.app.processes import per_process
+
+
+def test_object_is_built_once_per_process():
+    @per_process
+    def get_object():
+        return object()
+
+    assert get_object() is get_object()
+    parent = get_object()
+    with mock.patch("os.getpid", return_value=-1):
+        assert get_object() is not parent
+    assert get_object() is parent
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import threading
+
+import nostr.key as nk
+import pytest
+from nostr.event import Event
+from websockets.asyncio.server import serve
+
+from xedule.app.models import RelayStats
+from xedule.app.relays import RelayHealth
+from xedule.app.relays import RelayPool
+
+
+def _signed_event(content="hello"):
+    private_key = nk.PrivateKey()
+    event = Event(content=content, public_key=private_key.public_key.hex())
+    private_key.sign_event(event)
+    return event
+
+
+class FakeRelay:
+    """A relay server running on its own event loop thread."""
+
+    def __init__(self, reply=True, message=""):  # noqa: FBT002
+        self.reply = reply
+        self.message = message
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._server = self._run(self._serve())
+        self.url = f"ws://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _serve(self):
+        return await serve(self._handler, "127.0.0.1", 0)
+
+    async def _handler(self, websocket):
+        self.connections += 1
+        async for raw in websocket:
+            if self.reply is None:
+                continue
+            event = json.loads(raw)[1]
+            await websocket.send(
+                json.dumps(["OK", event["id"], self.reply, self.message]),
+            )
+
+    async def _close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def close(self):
+        self._run(self._close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture
+def relay_pool():
+    pool = RelayPool(keepalive=20, idle_timeout=600)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def fake_relays():
+    relays = []
+
+    def factory(**kwargs):
+        relay = FakeRelay(**kwargs)
+        relays.append(relay)
+        return relay
+
+    yield factory
+    for relay in relays:
+        relay.close()
+
+
+def test_publish_collects_ok_replies(relay_pool, fake_relays):
+    accepting = fake_relays()
+    rejecting = fake_relays(reply=False, message="blocked: spam")
+
+    results = relay_pool.publish([accepting.url, rejecting.url], _signed_event(), 5)
+
+    assert results[accepting.url]["accepted"] is True
+    assert results[accepting.url]["ack_time"] is not None
+    assert results[rejecting.url]["accepted"] is False
+    assert results[rejecting.url]["message"] == "blocked: spam"
+
+
+def test_publish_gives_up_on_silent_relay_after_deadline(relay_pool, fake_relays):
+    accepting = fake_relays()
+    silent = fake_relays(reply=None)
+
+    results = relay_pool.publish([accepting.url, silent.url], _signed_event(), 0.5)
+
+    assert results[accepting.url]["accepted"] is True
+    assert results[silent.url]["accepted"] is False
+    assert "No OK reply" in results[silent.url]["message"]
+
+
+def test_publish_reports_unreachable_relay(relay_pool):
+    results = relay_pool.publish(["ws://127.0.0.1:1"], _signed_event(), 0.5)
+
+    assert results["ws://127.0.0.1:1"]["accepted"] is False
+    assert "Not connected" in results["ws://127.0.0.1:1"]["message"]
+
+
+def test_connection_is_reused_across_events(relay_pool, fake_relays):
+    relay = fake_relays()
+
+    for content in ("first", "second", "third"):
+        results = relay_pool.publish([relay.url], _signed_event(content), 5)
+        assert results[relay.url]["accepted"] is True
+
+    assert relay.connections == 1
+
+
+def _result(url, accepted):
+    return {
+        "url": url,
+        "accepted": accepted,
+        "message": "" if accepted else "timeout",
+        "connect_time": 0.1,
+        "ack_time": 0.2 if accepted else None,
+        "elapsed": 0.3 if accepted else 5.0,
+    }
+
+
+class TestRelayHealth:
+    url = "wss://relay.example.com"
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        health = RelayHealth(failure_threshold=2, cooldown=300)
+
+        health.record({self.url: _result(self.url, accepted=False)})
+        assert health.available([self.url]) == [self.url]
+
+        health.record({self.url: _result(self.url, accepted=False)})
+        assert health.available([self.url]) == []
+
+    def test_single_probe_after_cooldown_closes_circuit(self):
+        health = RelayHealth(failure_threshold=1, cooldown=0)
+        health.record({self.url: _result(self.url, accepted=False)})
+
+        assert health.available([self.url]) == [self.url]
+        # Only one probe at a time while the circuit is half open
+        assert health.available([self.url]) == []
+
+        health.record({self.url: _result(self.url, accepted=True)})
+        assert health.available([self.url]) == [self.url]
+        assert health.available([self.url]) == [self.url]
+
+    @pytest.mark.django_db
+    def test_flush_writes_stats(self):
+        health = RelayHealth(failure_threshold=2, cooldown=300)
+        health.record({self.url: _result(self.url, accepted=True)})
+        health.record({self.url: _result(self.url, accepted=False)})
+        health.record({self.url: _result(self.url, accepted=False)})
+
+        health.flush()
+
+        stats = RelayStats.objects.get(url=self.url)
+        assert stats.publishes == 3  # noqa: PLR2004
+        assert stats.failures == 2  # noqa: PLR2004
+        assert stats.total_time == pytest.approx(10.3)
+        assert stats.avg_ack_time == pytest.approx(0.2)
+        assert stats.circuit_open_until is not None
+
+    @pytest.mark.django_db
+    def test_flush_picks_up_circuits_opened_elsewhere(self):
+        other_process = RelayHealth(failure_threshold=1, cooldown=300)
+        other_process.record({self.url: _result(self.url, accepted=False)})
+        other_process.flush()
+
+        health = RelayHealth(failure_threshold=1, cooldown=300)
+        health.flush()
+
+        assert health.available([self.url]) == []
+
+    @pytest.mark.django_db
+    def test_flush_drops_circuits_closed_from_the_admin(self):
+        health = RelayHealth(failure_threshold=1, cooldown=300)
+        health.record({self.url: _result(self.url, accepted=False)})
+        health.flush()
+
+        RelayStats.objects.filter(url=self.url).update(
+            circuit_open_until=None,
+            consecutive_failures=0,
+        )
+        health.flush()
+
+        assert health.available([self.url]) == [self.url]
+
+    @pytest.mark.django_db
+    def test_flush_keeps_circuits_opened_since_the_last_flush(self):
+        health = RelayHealth(failure_threshold=1, cooldown=300)
+        health.record({self.url: _result(self.url, accepted=True)})
+        health.flush()
+
+        health.record({self.url: _result(self.url, accepted=False)})
+        health.flush()
+
+        assert health.available([self.url]) == []
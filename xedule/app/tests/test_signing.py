@@ -0,0 +1,112 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import nostr.key as nk
+import pytest
+from django.core.management import call_command
+from nostr.event import Event
+
+from xedule.app.signing import NostrKeyCache
+from xedule.app.signing import decode_private_key
+from xedule.app.signing import decode_public_key
+from xedule.app.signing import get_nostr_key_cache
+from xedule.app.signing import get_signing_executor
+from xedule.app.signing import sign_events
+from xedule.app.tests.factories import NostrCredentialsFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestDecodeKeys:
+    def test_nsec_and_hex_give_the_same_key(self):
+        private_key = nk.PrivateKey()
+
+        from_nsec = decode_private_key(private_key.bech32())
+        from_hex = decode_private_key(f" {private_key.hex()} ")
+
+        assert from_nsec.raw_secret == from_hex.raw_secret == private_key.raw_secret
+
+    def test_npub(self):
+        public_key = nk.PrivateKey().public_key
+
+        assert decode_public_key(public_key.bech32()).hex() == public_key.hex()
+
+    @pytest.mark.parametrize(
+        "value",
+        ["", "nsec1invalid", "abcd", nk.PrivateKey().public_key.bech32()],
+    )
+    def test_invalid_private_key(self, value):
+        with pytest.raises(ValueError, match="key"):
+            decode_private_key(value)
+
+
+class TestNostrKeyCache:
+    def test_keys_are_decoded_once(self):
+        credentials = NostrCredentialsFactory.create()
+        cache = NostrKeyCache(maxsize=10)
+
+        private_key, public_key = cache.get(credentials)
+
+        assert cache.get(credentials)[0] is private_key
+        assert (
+            public_key == decode_private_key(credentials.private_key).public_key.hex()
+        )
+
+    def test_updated_credentials_are_decoded_again(self):
+        credentials = NostrCredentialsFactory.create()
+        cache = NostrKeyCache(maxsize=10)
+        cache.get(credentials)
+
+        new_key = nk.PrivateKey()
+        credentials.private_key = new_key.bech32()
+        credentials.save()
+
+        assert cache.get(credentials)[1] == new_key.public_key.hex()
+
+
+def test_saving_credentials_evicts_cached_keys():
+    credentials = NostrCredentialsFactory.create()
+    private_key, _ = get_nostr_key_cache().get(credentials)
+    updated_at = credentials.updated_at
+
+    credentials.save()
+    # Even with an unchanged key the keys must not come from the cache
+    credentials.updated_at = updated_at
+
+    assert get_nostr_key_cache().get(credentials)[0] is not private_key
+
+
+class TestSignEvents:
+    @pytest.fixture
+    def private_key(self):
+        return nk.PrivateKey()
+
+    @pytest.fixture
+    def events(self, private_key):
+        public_key = private_key.public_key.hex()
+        return [Event(content=f"note {i}", public_key=public_key) for i in range(5)]
+
+    def test_serial(self, private_key, events):
+        sign_events(private_key, events)
+
+        assert all(event.verify() for event in events)
+
+    def test_process_pool(self, private_key, events):
+        with ProcessPoolExecutor(
+            max_workers=2,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            sign_events(private_key, events, executor)
+
+        assert all(event.verify() for event in events)
+
+    def test_single_process_has_no_pool(self, settings):
+        settings.NOSTR_SIGNING_PROCESSES = 1
+
+        assert get_signing_executor() is None
+
+
+def test_benchmark_signing(capsys):
+    call_command("benchmark_signing", events=10, processes=[1])
+
+    assert "events/s" in capsys.readouterr().out
@@ -0,0 +1,1021 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import nostr.key as nk
+import pytest
+import requests
+import tweepy
+import urllib3
+from celery import current_app
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+
+from xedule.app.attempts import PublishAttemptLog
+from xedule.app.models import Note
+from xedule.app.models import NoteDelivery
+from xedule.app.models import PublishAttempt
+from xedule.app.models import PublishIntent
+from xedule.app.tasks import SKIPPED_SWEEPS_KEY
+from xedule.app.tasks import SWEEP_SKIPPED
+from xedule.app.tasks import _claim_notes
+from xedule.app.tasks import _close_worker_relay_pool
+from xedule.app.tasks import _due_notes
+from xedule.app.tasks import _open_worker_relay_pool
+from xedule.app.tasks import _record_published
+from xedule.app.tasks import _release_notes
+from xedule.app.tasks import _sign_nostr_events
+from xedule.app.tasks import _sweep_lock
+from xedule.app.tasks import finish_user_notes
+from xedule.app.tasks import prune_publish_attempts
+from xedule.app.tasks import publish_notes_to_twitter
+from xedule.app.tasks import publish_tweet
+from xedule.app.tasks import publish_user_notes
+from xedule.app.tasks import queue_publish
+from xedule.app.tasks import replay_dead_letters
+from xedule.app.tasks import resolve_publish_intents
+from xedule.app.tasks import retry_relay_deliveries
+from xedule.app.tasks import schedule_pending_tweets
+from xedule.app.tests.factories import NostrCredentialsFactory
+from xedule.app.tests.factories import NoteFactory
+from xedule.app.tests.factories import TwitterCredentialsFactory
+from xedule.app.twitter import get_twitter_quota
+from xedule.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def process_user_tweets():
+    with mock.patch(
+        "xedule.app.tasks.publish_user_notes.run",
+        side_effect=lambda user_id, note_ids: len(note_ids),
+    ) as process:
+        yield process
+
+
+@pytest.fixture
+def publish(settings):
+    """Publish notes to Twitter through the platform tasks, with `client`."""
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+
+    def publish(notes, client):
+        for user_id in {note.user_id for note in notes}:
+            TwitterCredentialsFactory.create(user_id=user_id)
+        with mock.patch("xedule.app.tasks.get_twitter_client", return_value=client):
+            for note in notes:
+                publish_user_notes.apply((note.user_id, [note.id])).get()
+
+    return publish
+
+
+class TestPublishTweet:
+    def test_dispatches_one_task_per_user_and_batch(
+        self,
+        settings,
+        process_user_tweets,
+    ):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.PUBLISH_BATCH_SIZE = 2
+        first_user, second_user = UserFactory.create_batch(2)
+        NoteFactory.create_batch(3, user=first_user)
+        NoteFactory.create(user=second_user)
+
+        result = publish_tweet.delay()
+
+        assert result.result == "Dispatched 4 notes in 3 tasks"
+        batches = sorted(
+            (call.args[0], len(call.args[1]))
+            for call in process_user_tweets.call_args_list
+        )
+        assert batches == [
+            (first_user.id, 1),
+            (first_user.id, 2),
+            (second_user.id, 1),
+        ]
+
+    def test_notes_are_streamed_in_pages(self, settings, process_user_tweets):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.PUBLISH_SWEEP_PAGE_SIZE = 2
+        first_user, second_user = UserFactory.create_batch(2)
+        notes = [
+            NoteFactory.create(user=first_user, scheduled_time=None),
+            *NoteFactory.create_batch(2, user=first_user),
+            *NoteFactory.create_batch(2, user=second_user),
+        ]
+
+        result = publish_tweet.delay()
+
+        assert result.result == "Dispatched 5 notes in 4 tasks"
+        published = [
+            note_id
+            for call in process_user_tweets.call_args_list
+            for note_id in call.args[1]
+        ]
+        assert sorted(published) == sorted(note.id for note in notes)
+
+    def test_run_out_of_time_continues_from_checkpoint(
+        self,
+        settings,
+        process_user_tweets,
+    ):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.PUBLISH_SWEEP_PAGE_SIZE = 2
+        settings.PUBLISH_SWEEP_TIME_BUDGET = -1
+        user = UserFactory.create()
+        notes = NoteFactory.create_batch(3, user=user)
+
+        with mock.patch("xedule.app.tasks.publish_tweet.delay") as delay:
+            assert publish_tweet() == "Dispatched 2 notes in 1 tasks"
+        [(note_ids, checkpoint)] = [call.args for call in delay.call_args_list]
+
+        assert note_ids is None
+        assert publish_tweet(note_ids, checkpoint) == "Dispatched 1 notes in 1 tasks"
+        published = [
+            note_id
+            for call in process_user_tweets.call_args_list
+            for note_id in call.args[1]
+        ]
+        assert sorted(published) == sorted(note.id for note in notes)
+
+    def test_published_count_is_collected_from_the_batches(
+        self, tweet_client, settings
+    ):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        for credentials in TwitterCredentialsFactory.create_batch(2):
+            NoteFactory.create(user=credentials.user)
+
+        with (
+            mock.patch(
+                "xedule.app.tasks.get_twitter_client", return_value=tweet_client
+            ),
+            mock.patch("xedule.app.tasks.collect_published_count.run") as collect,
+        ):
+            publish_tweet.delay()
+
+        collect.assert_called_once_with([1, 1])
+
+    def test_nothing_due(self, settings, process_user_tweets):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        NoteFactory.create(status="published")
+
+        result = publish_tweet.delay()
+
+        assert result.result == "There are no tweets pending to be published."
+        process_user_tweets.assert_not_called()
+
+
+def test_publish_user_notes_skips_notes_no_longer_due():
+    note = NoteFactory.create()
+    published = NoteFactory.create(user=note.user, status="published")
+    TwitterCredentialsFactory.create(user=note.user)
+
+    with mock.patch("xedule.app.tasks.chord") as chord:
+        publish_user_notes.apply((note.user_id, [note.id, published.id])).get()
+
+    [platform_task] = chord.call_args.args[0]
+    assert platform_task.args[1] == [note.id]
+
+
+@pytest.mark.parametrize(
+    ("task", "queue"),
+    [
+        ("xedule.app.tasks.publish_notes_to_twitter", "publish.twitter"),
+        ("xedule.app.tasks.publish_notes_to_nostr", "publish.nostr"),
+    ],
+)
+def test_platform_tasks_have_their_own_queue(task, queue):
+    route = current_app.amqp.router.route({}, task)
+
+    assert route["queue"].name == queue
+
+
+@pytest.mark.parametrize(
+    ("pool", "opened", "closed"),
+    [("threads", True, True), ("solo", False, True), ("prefork", False, False)],
+)
+def test_relay_pool_follows_workers_without_worker_processes(pool, opened, closed):
+    worker = mock.Mock(pool_cls=pool)
+
+    with (
+        mock.patch("xedule.app.tasks._open_relay_pool") as open_relay_pool,
+        mock.patch("xedule.app.tasks._close_relay_pool") as close_relay_pool,
+    ):
+        _open_worker_relay_pool(sender=worker)
+        _close_worker_relay_pool(sender=worker)
+
+    assert open_relay_pool.called == opened
+    assert close_relay_pool.called == closed
+
+
+class TestRetries:
+    @pytest.fixture(autouse=True)
+    def _retry_policy(self, settings):
+        settings.PUBLISH_RETRY_POLICY = {
+            **settings.PUBLISH_RETRY_POLICY,
+            "twitter": {"max_attempts": 3, "backoff_base": 60, "jitter": 0},
+        }
+
+    @pytest.fixture
+    def failing_client(self):
+        client = mock.Mock()
+        client.create_tweet.side_effect = tweepy.errors.TweepyException("boom")
+        return client
+
+    def test_failed_attempt_is_deferred(self, publish, failing_client):
+        note = NoteFactory.create()
+
+        with mock.patch("time.sleep") as sleep:
+            publish([note], failing_client)
+
+        sleep.assert_not_called()
+        note.refresh_from_db()
+        assert note.status == "pending"
+        assert note.attempts == 1
+        assert note.next_attempt_at is not None
+        assert note.next_attempt_at > timezone.now()
+        assert note.last_error == "Twitter error: boom"
+        assert not _due_notes().filter(id=note.id).exists()
+
+    def test_note_errors_after_max_attempts(self, publish, failing_client):
+        note = NoteFactory.create(attempts=2)
+
+        publish([note], failing_client)
+
+        note.refresh_from_db()
+        assert note.status == "dead_letter"
+        assert note.error_kind == "transient"
+        assert note.attempts == 3  # noqa: PLR2004
+        assert note.next_attempt_at is None
+
+    def test_server_error_is_retried(self, publish):
+        client = mock.Mock()
+        client.create_tweet.side_effect = tweepy.errors.TwitterServerError(
+            mock.Mock(status_code=503, headers={}, json=mock.Mock(return_value={})),
+        )
+        note = NoteFactory.create()
+
+        publish([note], client)
+
+        note.refresh_from_db()
+        assert note.status == "pending"
+        assert note.error_kind == "transient"
+        assert note.next_attempt_at is not None
+        assert note.next_attempt_at > timezone.now()
+
+
+class TestDeadLetters:
+    @pytest.mark.parametrize(
+        ("error", "kind"),
+        [
+            (tweepy.errors.Forbidden, "permanent"),
+            (tweepy.errors.Unauthorized, "credentials"),
+        ],
+    )
+    def test_final_error_is_dead_lettered_at_once(self, publish, error, kind):
+        client = mock.Mock()
+        client.create_tweet.side_effect = error(
+            mock.Mock(status_code=0, headers={}, json=mock.Mock(return_value={})),
+        )
+        note = NoteFactory.create()
+
+        publish([note], client)
+
+        note.refresh_from_db()
+        assert note.status == "dead_letter"
+        assert note.error_kind == kind
+        assert note.attempts == 0
+        assert not _due_notes().filter(id=note.id).exists()
+
+    def test_replay_keeps_published_platforms(self):
+        notes = [
+            NoteFactory.create(
+                status="dead_letter", attempts=3, error_kind="transient"
+            ),
+            NoteFactory.create(
+                status="dead_letter",
+                publish_to_nostr=True,
+                tweet_id="123",
+                error_kind="credentials",
+            ),
+            NoteFactory.create(status="published"),
+        ]
+
+        with mock.patch("xedule.app.tasks.queue_publish") as queue:
+            assert replay_dead_letters(Note.objects.all()) == 2  # noqa: PLR2004
+
+        statuses = dict(Note.objects.values_list("id", "status"))
+        assert [statuses[note.id] for note in notes] == [
+            "pending",
+            "partial",
+            "published",
+        ]
+        assert sorted(note.id for note in queue.call_args.args[0]) == [
+            notes[0].id,
+            notes[1].id,
+        ]
+        assert set(_due_notes()) == set(notes[:2])
+
+    def test_replay_command_filters_by_kind(self):
+        transient = NoteFactory.create(status="dead_letter", error_kind="transient")
+        NoteFactory.create(status="dead_letter", error_kind="credentials")
+        out = StringIO()
+
+        with mock.patch("xedule.app.tasks.queue_publish"):
+            call_command("replay_dead_letters", kind="transient", stdout=out)
+
+        assert "Replayed 1 notes" in out.getvalue()
+        assert list(Note.objects.filter(status="pending")) == [transient]
+
+
+class TestSweepLock:
+    @pytest.fixture(autouse=True)
+    def _clear_cache(self):
+        cache.clear()
+
+    @pytest.fixture
+    def previous_run(self):
+        lock = _sweep_lock()
+        assert lock.acquire()
+        yield lock
+        lock.release()
+
+    def test_overlapping_run_is_skipped(self, previous_run, process_user_tweets):
+        NoteFactory.create()
+
+        assert publish_tweet() == SWEEP_SKIPPED
+        assert publish_tweet() == SWEEP_SKIPPED
+
+        process_user_tweets.assert_not_called()
+        assert cache.get(SKIPPED_SWEEPS_KEY) == 2  # noqa: PLR2004
+
+    def test_tick_exits_without_dispatching(self, previous_run):
+        with mock.patch("xedule.app.tasks.publish_tweet.delay") as delay:
+            assert schedule_pending_tweets() == SWEEP_SKIPPED
+
+        delay.assert_not_called()
+
+    def test_lock_is_released_after_the_run(self):
+        publish_tweet()
+
+        assert not _sweep_lock().locked()
+
+
+def test_unscheduled_notes_are_due():
+    unscheduled = NoteFactory.create(scheduled_time=None)
+    NoteFactory.create(scheduled_time=timezone.now() + timedelta(hours=1))
+
+    assert list(_due_notes()) == [unscheduled]
+
+
+class TestClaims:
+    def test_claimed_notes_are_not_claimed_twice(self):
+        note = NoteFactory.create()
+
+        first = _claim_notes(_due_notes())
+        second = _claim_notes(_due_notes())
+
+        assert first == [note]
+        assert first[0].claimed_until > timezone.now()
+        assert second == []
+
+    def test_expired_lease_is_reclaimed(self):
+        note = NoteFactory.create(
+            claimed_by="crashed-worker",
+            claimed_until=timezone.now() - timedelta(seconds=1),
+        )
+
+        claimed = _claim_notes(_due_notes())
+
+        assert claimed == [note]
+        assert claimed[0].claimed_by != "crashed-worker"
+
+    def test_released_notes_can_be_claimed_again(self):
+        NoteFactory.create()
+        claimed = _claim_notes(_due_notes())
+
+        _release_notes(claimed)
+
+        assert Note.objects.get().claimed_until is None
+        assert len(_claim_notes(_due_notes())) == 1
+
+
+class TestCredentials:
+    def test_credentials_are_loaded_with_the_claim(
+        self,
+        tweet_client,
+        settings,
+        django_assert_num_queries,
+    ):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        credentials = TwitterCredentialsFactory.create()
+        notes = NoteFactory.create_batch(3, user=credentials.user)
+
+        # Claim (savepoint, lock, lease, release savepoint and one load that
+        # brings the user and credentials along), the Twitter task (lease
+        # renewal, load, intents, deliveries, per note the intent, its
+        # outcome and the tweet ID, then the deliveries and the attempts
+        # written at once) and the finish (load and one write per note)
+        with (
+            mock.patch(
+                "xedule.app.tasks.get_twitter_client", return_value=tweet_client
+            ),
+            django_assert_num_queries(24),
+        ):
+            published = publish_user_notes.apply(
+                (credentials.user_id, [note.id for note in notes])
+            ).get()
+
+        assert published == 3  # noqa: PLR2004
+
+    def test_user_without_credentials(self):
+        note = NoteFactory.create()
+
+        assert publish_user_notes.apply((note.user_id, [note.id])).get() == 0
+        note.refresh_from_db()
+        assert note.status == "dead_letter"
+        assert note.error_kind == "credentials"
+
+
+def test_nostr_events_are_signed_before_publishing():
+    private_key = nk.PrivateKey()
+    nostr_note = NoteFactory.create(publish_to_x=False, publish_to_nostr=True)
+    twitter_note = NoteFactory.create(user=nostr_note.user)
+    client_data = {
+        "private_key": private_key,
+        "public_key": private_key.public_key.hex(),
+        "relays": [],
+    }
+
+    events = _sign_nostr_events([nostr_note, twitter_note], client_data)
+
+    assert list(events) == [nostr_note.id]
+    assert events[nostr_note.id].verify()
+    assert nostr_note.scheduled_time is not None
+    assert events[nostr_note.id].created_at == int(
+        nostr_note.scheduled_time.timestamp(),
+    )
+
+
+class TestPreciseScheduling:
+    @pytest.fixture
+    def apply_async(self):
+        with mock.patch("xedule.app.tasks.publish_user_notes.apply_async") as apply:
+            yield apply
+
+    def test_note_due_soon_is_queued_for_its_time(
+        self,
+        apply_async,
+        django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            note = NoteFactory.create(
+                scheduled_time=timezone.now() + timedelta(seconds=5)
+            )
+
+        apply_async.assert_called_once_with(
+            (note.user_id, [note.id]),
+            eta=note.scheduled_time,
+        )
+
+    @pytest.mark.parametrize(
+        "scheduled_time",
+        [None, timezone.now() - timedelta(minutes=5)],
+        ids=["unscheduled", "past"],
+    )
+    def test_note_due_now_is_queued_right_away(
+        self,
+        scheduled_time,
+        apply_async,
+        django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            note = NoteFactory.create(scheduled_time=scheduled_time)
+
+        apply_async.assert_called_once_with((note.user_id, [note.id]), eta=None)
+
+    def test_note_waiting_for_a_retry_is_not_queued(
+        self,
+        apply_async,
+        django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            NoteFactory.create(next_attempt_at=timezone.now() + timedelta(hours=2))
+
+        apply_async.assert_not_called()
+
+    def test_notes_due_together_share_a_task(
+        self,
+        apply_async,
+        django_capture_on_commit_callbacks,
+    ):
+        user = UserFactory.create()
+        scheduled_time = timezone.now() + timedelta(minutes=5)
+        notes = NoteFactory.build_batch(3, user=user, scheduled_time=scheduled_time)
+        Note.objects.bulk_create(notes)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            queue_publish(notes)
+
+        apply_async.assert_called_once_with(
+            (user.id, [note.id for note in notes]),
+            eta=scheduled_time,
+        )
+
+    def test_later_notes_are_left_to_the_periodic_task(
+        self,
+        settings,
+        apply_async,
+        django_capture_on_commit_callbacks,
+    ):
+        settings.PUBLISH_ETA_HORIZON = 60
+
+        with django_capture_on_commit_callbacks(execute=True):
+            NoteFactory.create(scheduled_time=timezone.now() + timedelta(minutes=5))
+
+        apply_async.assert_not_called()
+
+
+def test_publish_lag_report():
+    now = timezone.now()
+    for lag in range(1, 101):
+        NoteFactory.create(
+            status="published",
+            scheduled_time=now - timedelta(seconds=lag),
+            published_at=now,
+        )
+    out = StringIO()
+
+    call_command("publish_lag", stdout=out)
+
+    assert "p50 lag: 50.0 s" in out.getvalue()
+    assert "p99 lag: 99.0 s" in out.getvalue()
+
+
+class TestPublishResult:
+    def test_platform_result_is_written_in_a_single_query(
+        self,
+        django_assert_num_queries,
+    ):
+        note = NoteFactory.create()
+
+        with django_assert_num_queries(1):
+            _record_published(note, "twitter", "123")
+
+        note.refresh_from_db()
+        assert note.status == "published"
+        assert note.tweet_id == "123"
+        assert note.published_at is not None
+
+    def test_platforms_finish_in_any_order(self):
+        first = NoteFactory.create(publish_to_nostr=True)
+        second = NoteFactory.create(publish_to_nostr=True)
+
+        _record_published(first, "twitter", "123")
+        _record_published(second, "nostr", "abc")
+        for note in (first, second):
+            note.refresh_from_db()
+        assert (first.status, second.status) == ("partial", "partial")
+
+        _record_published(first, "nostr", "abc")
+        _record_published(second, "twitter", "123")
+        for note in (first, second):
+            note.refresh_from_db()
+            assert note.status == "published"
+            assert note.published_at is not None
+
+    def test_published_note_is_released(self, publish, tweet_client):
+        note = NoteFactory.create()
+
+        publish([note], tweet_client)
+
+        note.refresh_from_db()
+        assert note.status == "published"
+        assert note.claimed_until is None
+
+    def test_partial_publish(self, publish, tweet_client):
+        note = NoteFactory.create(publish_to_nostr=True)
+
+        publish([note], tweet_client)
+
+        note.refresh_from_db()
+        assert note.status == "dead_letter"
+        assert note.error_kind == "credentials"
+        assert note.tweet_id == "123"
+        assert note.last_error == "User does not have Nostr credentials configured"
+
+    def test_concurrent_edit_keeps_tweet_id(self, tweet_client):
+        note = NoteFactory.create()
+        TwitterCredentialsFactory.create(user=note.user)
+        [claimed] = _claim_notes(_due_notes())
+        edited = Note.objects.get(id=note.id)
+        edited.content = "Edited while publishing"
+        edited.save()
+
+        with mock.patch(
+            "xedule.app.tasks.get_twitter_client", return_value=tweet_client
+        ):
+            results = publish_notes_to_twitter(
+                note.user_id, [note.id], claimed.claimed_by
+            )
+        finish_user_notes([results], note.user_id, [note.id], claimed.claimed_by)
+
+        note.refresh_from_db()
+        assert note.tweet_id == "123"
+        assert note.content == "Edited while publishing"
+        assert note.claimed_until is None
+
+
+class TestDeliveries:
+    @pytest.fixture
+    def relays(self, settings):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.NOSTR_DEFAULT_RELAYS = []
+        return ["wss://up.example", "wss://down.example"]
+
+    def _relay_results(self, relays, accepted):
+        return {
+            url: {
+                "url": url,
+                "accepted": url in accepted,
+                "message": "" if url in accepted else "timeout",
+                "elapsed": 0.25,
+            }
+            for url in relays
+        }
+
+    def _publish_event(self, accepted):
+        return mock.patch(
+            "xedule.app.tasks.publish_event",
+            side_effect=lambda relays, event: self._relay_results(relays, accepted),
+        )
+
+    def test_tweet_is_recorded_per_account(self, tweet_client, publish):
+        note = NoteFactory.create()
+
+        publish([note], tweet_client)
+
+        delivery = NoteDelivery.objects.get()
+        account = note.user.twitter_credentials.access_token.partition("-")[0]
+        assert (delivery.platform, delivery.target) == ("twitter", account)
+        assert delivery.status == "delivered"
+        assert delivery.remote_id == "123"
+        assert delivery.latency is not None
+
+    def test_only_failed_relays_are_retried(self, relays):
+        credentials = NostrCredentialsFactory.create(relay_urls="\n".join(relays))
+        note = NoteFactory.create(
+            user=credentials.user,
+            publish_to_x=False,
+            publish_to_nostr=True,
+        )
+
+        with self._publish_event(accepted={"wss://up.example"}):
+            publish_user_notes.apply((note.user_id, [note.id])).get()
+
+        note.refresh_from_db()
+        assert note.status == "published"
+        down = NoteDelivery.objects.get(target="wss://down.example")
+        assert down.status == "failed"
+        assert down.next_attempt_at is not None
+        assert down.next_attempt_at > timezone.now()
+
+        NoteDelivery.objects.update(next_attempt_at=timezone.now())
+        with self._publish_event(accepted={"wss://down.example"}) as publish_event:
+            assert retry_relay_deliveries() == "Retried 1 relay deliveries"
+
+        [(sent_to, event)] = [call.args for call in publish_event.call_args_list]
+        assert sent_to == ["wss://down.example"]
+        assert event.id == note.nostr_id
+        down.refresh_from_db()
+        assert down.status == "delivered"
+        assert down.attempts == 2  # noqa: PLR2004
+        assert down.next_attempt_at is None
+
+    def test_note_retry_skips_relays_that_took_the_event(self, relays, settings):
+        settings.PUBLISH_RETRY_POLICY = {
+            **settings.PUBLISH_RETRY_POLICY,
+            "nostr": {"max_attempts": 3, "backoff_base": 0, "jitter": 0},
+        }
+        credentials = NostrCredentialsFactory.create(relay_urls="\n".join(relays))
+        note = NoteFactory.create(
+            user=credentials.user,
+            publish_to_x=False,
+            publish_to_nostr=True,
+        )
+        NoteDelivery.objects.create(
+            note=note,
+            platform="nostr",
+            target="wss://up.example",
+            status="delivered",
+        )
+
+        with self._publish_event(accepted=set()) as publish_event:
+            publish_user_notes.apply((note.user_id, [note.id])).get()
+
+        assert publish_event.call_args.args[0] == ["wss://down.example"]
+
+
+class TestPublishAttempts:
+    def test_tweet_attempt_timeline(self, publish):
+        client = mock.Mock()
+        client.create_tweet.side_effect = tweepy.errors.Forbidden(
+            mock.Mock(status_code=403, headers={}, json=mock.Mock(return_value={})),
+        )
+        note = NoteFactory.create()
+
+        publish([note], client)
+
+        attempt = PublishAttempt.objects.get()
+        assert (attempt.platform, attempt.outcome) == ("twitter", "failed")
+        assert (attempt.error_kind, attempt.error_class) == ("permanent", "Forbidden")
+        assert attempt.http_status == 403  # noqa: PLR2004
+        assert attempt.queued_at is not None
+        assert attempt.claimed_at is not None
+        assert attempt.sent_at is not None
+        assert attempt.acked_at is not None
+        assert (
+            attempt.queued_at
+            <= attempt.claimed_at
+            <= attempt.sent_at
+            <= attempt.acked_at
+        )
+
+    def test_relay_counts(self, settings):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.NOSTR_DEFAULT_RELAYS = ["wss://up.example", "wss://down.example"]
+        credentials = NostrCredentialsFactory.create()
+        note = NoteFactory.create(
+            user=credentials.user,
+            publish_to_x=False,
+            publish_to_nostr=True,
+        )
+
+        with mock.patch(
+            "xedule.app.tasks.publish_event",
+            side_effect=lambda relays, event: {
+                url: {"accepted": url == relays[0], "message": "", "elapsed": 0.1}
+                for url in relays
+            },
+        ):
+            publish_user_notes.apply((note.user_id, [note.id])).get()
+
+        attempt = PublishAttempt.objects.get()
+        assert attempt.outcome == "published"
+        assert (attempt.relays_accepted, attempt.relay_count) == (1, 2)
+        assert attempt.signed_at is not None
+        assert attempt.sent_at is not None
+        assert attempt.acked_at is not None
+        assert attempt.signed_at <= attempt.sent_at <= attempt.acked_at
+
+    def test_attempts_are_written_in_batches(self):
+        log = PublishAttemptLog(batch_size=2)
+        note = NoteFactory.create()
+
+        log.add(PublishAttempt(note=note, platform="twitter", outcome="failed"))
+        assert not PublishAttempt.objects.exists()
+        log.add(PublishAttempt(note=note, platform="twitter", outcome="published"))
+
+        assert PublishAttempt.objects.count() == 2  # noqa: PLR2004
+
+    def test_old_attempts_are_pruned(self, settings):
+        settings.PUBLISH_ATTEMPT_RETENTION = 7
+        note = NoteFactory.create()
+        old, recent = PublishAttempt.objects.bulk_create(
+            [
+                PublishAttempt(note=note, platform="twitter", outcome="failed"),
+                PublishAttempt(note=note, platform="twitter", outcome="published"),
+            ],
+        )
+        PublishAttempt.objects.filter(id=old.id).update(
+            created_at=timezone.now() - timedelta(days=8),
+        )
+
+        assert prune_publish_attempts() == "Pruned 1 publish attempts"
+        assert list(PublishAttempt.objects.values_list("id", flat=True)) == [
+            recent.id,
+        ]
+
+
+class WorkerKilledError(BaseException):
+    """Stands for the worker dying: not even `except Exception` stops it."""
+
+
+class TestPublishIntents:
+    def _crash_after_posting(self, note, tweet_client, crash_point):
+        """Publish `note` and kill the worker at `crash_point`."""
+        TwitterCredentialsFactory.create(user=note.user)
+        [claimed] = _claim_notes(_due_notes())
+        with (
+            mock.patch(
+                "xedule.app.tasks.get_twitter_client", return_value=tweet_client
+            ),
+            mock.patch(crash_point, side_effect=WorkerKilledError),
+            pytest.raises(WorkerKilledError),
+        ):
+            publish_notes_to_twitter(note.user_id, [note.id], claimed.claimed_by)
+        # The lease runs out and the note is picked up again
+        _release_notes([claimed])
+
+    def _publish_again(self, settings, note, tweet_client):
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        with mock.patch(
+            "xedule.app.tasks.get_twitter_client", return_value=tweet_client
+        ):
+            publish_user_notes.apply((note.user_id, [note.id])).get()
+        note.refresh_from_db()
+
+    def test_crash_before_the_intent_is_updated_holds_the_note(
+        self,
+        settings,
+        tweet_client,
+    ):
+        note = NoteFactory.create()
+        self._crash_after_posting(
+            note, tweet_client, "xedule.app.tasks.record_rate_limit"
+        )
+
+        self._publish_again(settings, note, tweet_client)
+
+        assert tweet_client.create_tweet.call_count == 1
+        assert note.status == "dead_letter"
+        assert note.error_kind == "in_doubt"
+
+    def test_crash_before_the_tweet_id_is_stored_is_reconciled(
+        self,
+        settings,
+        tweet_client,
+    ):
+        note = NoteFactory.create()
+        self._crash_after_posting(
+            note, tweet_client, "xedule.app.tasks._record_published"
+        )
+
+        self._publish_again(settings, note, tweet_client)
+
+        assert tweet_client.create_tweet.call_count == 1
+        assert note.status == "published"
+        assert note.tweet_id == "123"
+
+    @pytest.mark.parametrize(
+        ("posted", "tweets"),
+        [(True, 1), (False, 2)],
+        ids=["posted", "not-posted"],
+    )
+    def test_resolved_intent_releases_the_note(
+        self,
+        settings,
+        tweet_client,
+        posted,
+        tweets,
+    ):
+        note = NoteFactory.create()
+        self._crash_after_posting(
+            note, tweet_client, "xedule.app.tasks.record_rate_limit"
+        )
+        self._publish_again(settings, note, tweet_client)
+        PublishIntent.objects.update(platform_id="123")
+
+        with mock.patch("xedule.app.tasks.queue_publish"):
+            resolve_publish_intents(PublishIntent.objects.all(), posted=posted)
+        self._publish_again(settings, note, tweet_client)
+
+        assert tweet_client.create_tweet.call_count == tweets
+        assert note.status == "published"
+        assert note.tweet_id == "123"
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            requests.exceptions.ConnectionError("Connection aborted"),
+            requests.exceptions.ReadTimeout("Read timed out"),
+            tweepy.errors.TwitterServerError(
+                mock.Mock(status_code=503, headers={}, json=mock.Mock(return_value={})),
+            ),
+        ],
+        ids=["network-error", "read-timeout", "server-error"],
+    )
+    def test_failure_after_sending_holds_the_note(self, settings, tweet_client, error):
+        note = NoteFactory.create()
+        TwitterCredentialsFactory.create(user=note.user)
+        tweet_client.create_tweet.side_effect = [
+            error,
+            tweet_client.create_tweet.return_value,
+        ]
+        self._publish_again(settings, note, tweet_client)
+        assert PublishIntent.objects.get().state == "pending"
+        # The backoff is over
+        Note.objects.filter(id=note.id).update(next_attempt_at=None)
+
+        self._publish_again(settings, note, tweet_client)
+
+        assert tweet_client.create_tweet.call_count == 1
+        assert note.status == "dead_letter"
+        assert note.error_kind == "in_doubt"
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            requests.exceptions.ConnectTimeout("Connection timed out"),
+            requests.exceptions.ConnectionError(
+                urllib3.exceptions.MaxRetryError(
+                    pool=urllib3.HTTPSConnectionPool("api.x.com"),
+                    url="/2/tweets",
+                    reason=urllib3.exceptions.NewConnectionError(
+                        urllib3.connection.HTTPSConnection("api.x.com"),
+                        "Connection refused",
+                    ),
+                ),
+            ),
+        ],
+        ids=["connect-timeout", "connection-refused"],
+    )
+    def test_failure_to_connect_retries_the_note(self, settings, tweet_client, error):
+        note = NoteFactory.create()
+        TwitterCredentialsFactory.create(user=note.user)
+        tweet_client.create_tweet.side_effect = [
+            error,
+            tweet_client.create_tweet.return_value,
+        ]
+        self._publish_again(settings, note, tweet_client)
+        assert not PublishIntent.objects.exists()
+        # The backoff is over
+        Note.objects.filter(id=note.id).update(next_attempt_at=None)
+
+        self._publish_again(settings, note, tweet_client)
+
+        assert tweet_client.create_tweet.call_count == 2  # noqa: PLR2004
+        assert note.status == "published"
+        assert note.tweet_id == "123"
+
+    def test_refused_post_leaves_no_intent(self, publish):
+        client = mock.Mock()
+        client.create_tweet.side_effect = tweepy.errors.Forbidden(
+            mock.Mock(status_code=403, headers={}, json=mock.Mock(return_value={})),
+        )
+
+        publish([NoteFactory.create()], client)
+
+        assert not PublishIntent.objects.exists()
+
+
+class TestRateLimits:
+    @pytest.fixture(autouse=True)
+    def _clear_cache(self):
+        cache.clear()
+        yield
+        cache.clear()
+
+    def _response(self, status_code, remaining, reset):
+        return mock.Mock(
+            status_code=status_code,
+            headers={
+                "x-rate-limit-limit": "100",
+                "x-rate-limit-remaining": str(remaining),
+                "x-rate-limit-reset": str(reset),
+            },
+            json=mock.Mock(return_value={"data": {"id": "123"}}),
+        )
+
+    def test_rate_limited_note_waits_for_reset_without_attempt(self, publish):
+        reset = int(time.time()) + 600
+        client = mock.Mock()
+        client.create_tweet.side_effect = tweepy.errors.TooManyRequests(
+            self._response(429, 0, reset),
+        )
+        first, second = NoteFactory.create_batch(2, user=UserFactory.create())
+
+        publish([first, second], client)
+
+        # The second note did not even reach the API, nor wrote an intent
+        assert client.create_tweet.call_count == 1
+        assert not PublishIntent.objects.exists()
+        for note in (first, second):
+            note.refresh_from_db()
+            assert note.status == "pending"
+            assert note.attempts == 0
+            assert note.next_attempt_at is not None
+            assert note.next_attempt_at.timestamp() == reset
+        assert get_twitter_quota(first.user_id) == {
+            "remaining": 0,
+            "limit": 100,
+            "reset": reset,
+        }
+
+    def test_quota_is_taken_from_response_headers(self, publish):
+        reset = int(time.time()) + 600
+        client = mock.Mock()
+        client.create_tweet.side_effect = [
+            self._response(201, 1, reset),
+            self._response(201, 0, reset),
+        ]
+        first, second, third = NoteFactory.create_batch(3, user=UserFactory.create())
+
+        publish([first, second, third], client)
+
+        assert client.create_tweet.call_count == 2  # noqa: PLR2004
+        third.refresh_from_db()
+        assert third.next_attempt_at is not None
+        assert third.next_attempt_at.timestamp() == reset
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from xedule.app import tracing
+from xedule.app.tests.factories import NoteFactory
+
+
+@pytest.fixture(autouse=True)
+def _tracer_per_test():
+    tracing._tracer_provider.cache_clear()  # noqa: SLF001
+    yield
+    tracing._tracer_provider.cache_clear()  # noqa: SLF001
+
+
+def test_tracing_off_is_a_no_op(settings):
+    settings.TRACING_EXPORTER = ""
+
+    with tracing.span("publish.twitter", note_id=1) as span:
+        assert span is None
+        assert tracing.current_trace_context() == {}
+    tracing.record_span("db.claim", 0, 1)
+
+
+def test_missing_opentelemetry_turns_tracing_off(settings, monkeypatch):
+    settings.TRACING_EXPORTER = "file"
+    monkeypatch.setattr(tracing, "trace", None)
+
+    assert tracing.get_tracer() is None
+
+
+@pytest.mark.django_db
+def test_publish_spans_continue_the_trace_of_the_note(settings, tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    settings.TRACING_EXPORTER = "file"
+    settings.TRACING_FILE = str(tmp_path / "traces.jsonl")
+    settings.TRACING_SAMPLE_RATE = 1.0
+
+    with tracing.span("note.create"):
+        note = NoteFactory.create(trace_context=tracing.current_trace_context())
+    with tracing.span("publish.nostr", note.trace_context, note_id=note.id):
+        tracing.record_relay_spans(
+            0.0,
+            {"wss://a": {"connect_time": 0.1, "ack_time": 0.2, "accepted": True}},
+        )
+    tracing.flush_traces()
+
+    spans = {
+        span["name"]: span
+        for span in map(json.loads, open(settings.TRACING_FILE))  # noqa: PTH123, SIM115
+    }
+    trace_ids = {span["context"]["trace_id"] for span in spans.values()}
+    assert set(spans) == {"note.create", "publish.nostr", "relay.connect", "relay.ack"}
+    assert len(trace_ids) == 1
@@ -0,0 +1,62 @@
+import pytest
+
+from xedule.app.tests.factories import TwitterCredentialsFactory
+from xedule.app.twitter import TwitterClientCache
+from xedule.app.twitter import get_twitter_client
+from xedule.app.twitter import get_twitter_client_cache
+from xedule.app.twitter import get_twitter_session
+
+pytestmark = pytest.mark.django_db
+
+
+class TestTwitterClientCache:
+    def test_client_is_reused(self):
+        credentials = TwitterCredentialsFactory.create()
+        cache = TwitterClientCache(maxsize=10)
+
+        assert cache.get(credentials) is cache.get(credentials)
+
+    def test_clients_share_the_process_session(self):
+        cache = TwitterClientCache(maxsize=10)
+
+        first = cache.get(TwitterCredentialsFactory.create())
+        second = cache.get(TwitterCredentialsFactory.create())
+
+        assert first is not second
+        assert first.session is second.session is get_twitter_session()
+
+    def test_updated_credentials_get_a_new_client(self):
+        credentials = TwitterCredentialsFactory.create()
+        cache = TwitterClientCache(maxsize=10)
+        client = cache.get(credentials)
+
+        credentials.access_token = "new-token"  # noqa: S105
+        credentials.save()
+
+        assert cache.get(credentials) is not client
+        assert cache.get(credentials).access_token == credentials.access_token
+
+    def test_least_recently_used_client_is_dropped(self):
+        first, second, third = TwitterCredentialsFactory.create_batch(3)
+        cache = TwitterClientCache(maxsize=2)
+        first_client = cache.get(first)
+        second_client = cache.get(second)
+        cache.get(first)
+
+        cache.get(third)
+
+        assert cache.get(first) is first_client
+        assert cache.get(second) is not second_client
+
+
+def test_saving_credentials_evicts_cached_client():
+    credentials = TwitterCredentialsFactory.create()
+    client = get_twitter_client(credentials)
+    updated_at = credentials.updated_at
+
+    credentials.save()
+    # Even with an unchanged key the client must not come from the cache
+    credentials.updated_at = updated_at
+
+    assert get_twitter_client(credentials) is not client
+    get_twitter_client_cache().evict(credentials.user_id)
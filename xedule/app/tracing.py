@@ -0,0 +1,158 @@
+import contextlib
+import logging
+import os
+
+from django.conf import settings
+
+from .processes import per_process
+
+try:
+    from opentelemetry import propagate
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased
+    from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+except ImportError:
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "xedule"
+
+
+def _span_exporter():
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        # Endpoint and headers come from the OTEL_EXPORTER_OTLP_* variables
+        return OTLPSpanExporter()
+    # One JSON span per line
+    return ConsoleSpanExporter(
+        out=open(settings.TRACING_FILE, "a"),  # noqa: PTH123
+        formatter=lambda span: span.to_json(indent=None) + os.linesep,
+    )
+
+
+@per_process
+def _tracer_provider():
+    if not settings.TRACING_EXPORTER:
+        return None
+    if trace is None:
+        logger.warning("TRACING_EXPORTER is set but OpenTelemetry is not installed")
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(_span_exporter()))
+    return provider
+
+
+def get_tracer():
+    """
+    Return the tracer of the current process, or None with tracing off.
+
+    Each process gets its own provider, since the thread exporting spans
+    does not survive a fork.
+    """
+    provider = _tracer_provider()
+    return provider.get_tracer(__name__) if provider else None
+
+
+def flush_traces():
+    """Export the spans the current process still holds."""
+    provider = _tracer_provider()
+    if provider:
+        provider.force_flush()
+
+
+def current_trace_context():
+    """The trace context of the active span, to store on notes."""
+    if get_tracer() is None:
+        return {}
+    carrier: dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def _attributes(attributes):
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+def span(name, trace_context=None, **attributes):
+    """
+    Context manager running its block in a span named `name`.
+
+    The span is a child of `trace_context`, as returned by
+    current_trace_context, or of the active span without it. With tracing
+    off this is a no-op.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.start_as_current_span(
+        name,
+        context=propagate.extract(trace_context) if trace_context else None,
+        attributes=_attributes(attributes),
+    )
+
+
+def _ns(timestamp):
+    return int(timestamp * 1e9)
+
+
+def record_span(name, start, end, trace_context=None, **attributes):
+    """
+    Record a span that already happened, from `start` to `end`.
+
+    Used for steps timed outside of this process's control, like a batch
+    shared by several notes or a relay call on the relay pool's loop. Times
+    are epoch seconds.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return
+    recorded = tracer.start_span(
+        name,
+        context=propagate.extract(trace_context) if trace_context else None,
+        attributes=_attributes(attributes),
+        start_time=_ns(start),
+    )
+    recorded.end(end_time=_ns(end))
+
+
+def record_note_spans(name, notes, start, end):
+    """Record a step done for a batch of notes in the trace of each one."""
+    if get_tracer() is None:
+        return
+    for note in notes:
+        record_span(name, start, end, note.trace_context, note_id=note.id)
+
+
+def record_relay_spans(sent_at, relay_results):
+    """
+    Record the connect and ack spans of each relay an event was sent to.
+
+    The spans are children of the active span. `sent_at` is when the event
+    was handed to the relay pool, as an epoch time.
+    """
+    if get_tracer() is None:
+        return
+    for url, result in relay_results.items():
+        if result.get("connect_time") is None:
+            continue
+        connected_at = sent_at + result["connect_time"]
+        record_span("relay.connect", sent_at, connected_at, relay=url)
+        if result.get("ack_time") is not None:
+            record_span(
+                "relay.ack",
+                connected_at,
+                connected_at + result["ack_time"],
+                relay=url,
+                accepted=result["accepted"],
+            )
@@ -0,0 +1,217 @@
+import logging
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+import tweepy
+import urllib3
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from .caches import CredentialsCache
+from .processes import per_process
+
+logger = logging.getLogger(__name__)
+
+# Header families the API uses to report limits on POST /2/tweets
+RATE_LIMIT_HEADERS = (
+    ("x-rate-limit-limit", "x-rate-limit-remaining", "x-rate-limit-reset"),
+    (
+        "x-user-limit-24hour-limit",
+        "x-user-limit-24hour-remaining",
+        "x-user-limit-24hour-reset",
+    ),
+    (
+        "x-app-limit-24hour-limit",
+        "x-app-limit-24hour-remaining",
+        "x-app-limit-24hour-reset",
+    ),
+)
+# Assumed wait when a 429 response carries no usable rate limit headers
+DEFAULT_RATE_LIMIT_WINDOW = 15 * 60  # seconds
+
+
+@per_process
+def get_twitter_session():
+    """
+    Return the HTTP session shared by every Twitter client of this process.
+
+    Sharing one connection pool lets consecutive posts, from any account,
+    reuse warm keep-alive connections to the API.
+    """
+    session = requests.Session()
+    # Requests are signed per account with OAuth 1.0a, so the session carries
+    # no state of its own. Never let cookies leak from one account to another.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.TWITTER_HTTP_POOL_SIZE,
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+class TwitterClientCache(CredentialsCache):
+    """Least recently used cache of Twitter clients, keyed by user."""
+
+    def build(self, credentials):
+        client = tweepy.Client(
+            consumer_key=credentials.api_key,
+            consumer_secret=credentials.api_secret_key,
+            access_token=credentials.access_token,
+            access_token_secret=credentials.access_token_secret,
+            # Keep the raw response to read the rate limit headers
+            return_type=requests.Response,
+        )
+        client.session = get_twitter_session()
+        return client
+
+
+@per_process
+def get_twitter_client_cache():
+    """Return the Twitter client cache of the current process."""
+    return TwitterClientCache(maxsize=settings.TWITTER_CLIENT_CACHE_SIZE)
+
+
+def get_twitter_client(credentials):
+    """Return a Twitter API client for the given credentials."""
+    return get_twitter_client_cache().get(credentials)
+
+
+def _quota_keys(user_id):
+    prefix = f"twitter-quota:{user_id}"
+    return f"{prefix}:remaining", f"{prefix}:limit", f"{prefix}:reset"
+
+
+def _parse_rate_limit(headers):
+    """
+    Return the tightest (limit, remaining, reset) reported in `headers`.
+
+    The most restrictive window is the one with the fewest posts left; ties
+    go to the one that resets last.
+    """
+    windows = []
+    for limit_header, remaining_header, reset_header in RATE_LIMIT_HEADERS:
+        try:
+            windows.append(
+                (
+                    int(headers[remaining_header]),
+                    -int(headers[reset_header]),
+                    int(headers.get(limit_header, 0)),
+                ),
+            )
+        except (KeyError, TypeError, ValueError):
+            continue
+    if not windows:
+        return None
+    remaining, reset, limit = min(windows)
+    return limit, remaining, -reset
+
+
+def record_rate_limit(user_id, response, *, exhausted=False):
+    """
+    Store the account's quota as reported by a Twitter API response.
+
+    The quota lives in the cache (Redis in production), so every worker
+    sees the same bucket. With `exhausted` (an HTTP 429) the bucket is
+    emptied even if the response carries no rate limit headers.
+    """
+    headers = response.headers if response is not None else {}
+    rate_limit = _parse_rate_limit(headers)
+    now = int(time.time())
+    if rate_limit is None:
+        if not exhausted:
+            return
+        rate_limit = (0, 0, now + DEFAULT_RATE_LIMIT_WINDOW)
+    limit, remaining, reset = rate_limit
+    if exhausted:
+        remaining = 0
+
+    remaining_key, limit_key, reset_key = _quota_keys(user_id)
+    cache.set_many(
+        {remaining_key: remaining, limit_key: limit, reset_key: reset},
+        timeout=max(reset - now, 1),
+    )
+    if remaining == 0:
+        logger.warning(
+            "Twitter rate limit reached for user %s until %s",
+            user_id,
+            time.strftime("%H:%M:%S", time.localtime(reset)),
+        )
+
+
+def twitter_account_id(credentials):
+    """The id of the X account the credentials post as."""
+    # OAuth 1.0a access tokens start with the id of their account
+    return credentials.access_token.partition("-")[0]
+
+
+def classify_twitter_error(error):
+    """
+    The kind of error a failed Twitter API call ran into.
+
+    Rate limits wait for the quota to refill and server or network errors
+    are retried. Rejected credentials (401) and rejected posts, such as a
+    403 for duplicate content, would fail again as they are.
+    """
+    if isinstance(error, tweepy.errors.TooManyRequests):
+        return "rate_limited"
+    if isinstance(error, tweepy.errors.Unauthorized):
+        return "credentials"
+    if isinstance(error, tweepy.errors.TwitterServerError):
+        return "transient"
+    if isinstance(error, tweepy.errors.HTTPException):
+        return "permanent"
+    return "transient"
+
+
+def twitter_request_sent(error):
+    """
+    Whether the request that raised `error` may have reached Twitter.
+
+    Only a failure to connect proves that nothing was sent. After a reset
+    or a read timeout the post may have been made.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], "reason", None)
+        return not isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return True
+
+
+def acquire_tweet_quota(user_id):
+    """
+    Take one post from the account's bucket.
+
+    Returns None when the post may go ahead, or the epoch time at which the
+    bucket refills when the account has no posts left. Accounts without a
+    known quota are always allowed.
+    """
+    remaining_key, _, reset_key = _quota_keys(user_id)
+    try:
+        remaining = cache.decr(remaining_key)
+    except ValueError:
+        return None
+    if remaining >= 0:
+        return None
+    return cache.get(reset_key) or int(time.time()) + DEFAULT_RATE_LIMIT_WINDOW
+
+
+def get_twitter_quota(user_id):
+    """
+    Return the account's last known quota, for monitoring.
+
+    A dict with `remaining`, `limit` and `reset` (epoch seconds), or None
+    when no request has been made within the current window.
+    """
+    remaining_key, limit_key, reset_key = _quota_keys(user_id)
+    values = cache.get_many([remaining_key, limit_key, reset_key])
+    if remaining_key not in values:
+        return None
+    return {
+        "remaining": max(values[remaining_key], 0),
+        "limit": values.get(limit_key),
+        "reset": values.get(reset_key),
+    }
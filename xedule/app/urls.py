@@ -39,4 +39,5 @@ urlpatterns = [
         views.NostrCredentialsUpdateView.as_view(),
         name="nostr_credentials",
     ),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
 ]
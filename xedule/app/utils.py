@@ -1,8 +1,12 @@
 # app/utils.py
 
 import pandas as pd
+from django.utils import timezone
 
+from .due_index import index_notes_on_commit
 from .models import Note
+from .tasks import queue_publish
+from .tracing import current_trace_context
 
 TWEET_LENGTH = 280
 
@@ -31,7 +35,15 @@ def process_excel_file(excel_file, user):
             process_row(index, row, data_table, user)
             for index, row in data_table.iterrows()
         ]
-        result["notes_created"] = sum(1 for r in row_results if r["success"])
+        # Create every valid note in one query and add them to the due index
+        notes = [r["note"] for r in row_results if r["success"]]
+        trace_context = current_trace_context()
+        for note in notes:
+            note.trace_context = trace_context
+        notes = Note.objects.bulk_create(notes)
+        index_notes_on_commit(notes)
+        queue_publish(notes)
+        result["notes_created"] = len(notes)
         result["notes_failed"] = sum(1 for r in row_results if not r["success"])
         result["error_messages"] = [
             r["message"] for r in row_results if not r["success"]
@@ -45,14 +57,14 @@ def process_excel_file(excel_file, user):
 
 
 def process_row(index, row, data_table, user):
-    """Process a single row from the Excel file."""
+    """Process a single row from the Excel file into an unsaved note."""
     try:
         content = validate_content(index, row)
         scheduled_time = handle_scheduled_time(index, row, data_table)
         publish_to_x = handle_publish_to_x(row, data_table)
         publish_to_nostr = handle_publish_to_nostr(row, data_table)
 
-        Note.objects.create(
+        note = Note(
             user=user,
             content=content,
             scheduled_time=scheduled_time,
@@ -65,7 +77,7 @@ def process_row(index, row, data_table, user):
         return {"success": False, "message": f"Row {index + 1}: {e!s}"}
 
     else:
-        return {"success": True}
+        return {"success": True, "note": note}
 
 
 class ContentValidationError(ValueError):
@@ -92,7 +104,11 @@ def handle_scheduled_time(index, row, data_table):
     if "scheduled_time" in data_table.columns and not pd.isna(
         row.get("scheduled_time")
     ):
-        return row["scheduled_time"]
+        scheduled_time = pd.Timestamp(row["scheduled_time"]).to_pydatetime()
+        # Naive times are in the site's time zone, as Django would read them
+        if timezone.is_naive(scheduled_time):
+            scheduled_time = timezone.make_aware(scheduled_time)
+        return scheduled_time
     return None
 
 
@@ -1,14 +1,19 @@
 # tweets/views.py
+import hmac
 from io import BytesIO
 
 import pandas as pd
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404
 from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import CreateView
 from django.views.generic import DeleteView
@@ -16,14 +21,19 @@ from django.views.generic import DetailView
 from django.views.generic import ListView
 from django.views.generic import UpdateView
 from django.views.generic.edit import FormView
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import generate_latest
 
 from .forms import ExcelUploadForm
 from .forms import NostrCredentialsForm
 from .forms import TweetForm
 from .forms import TwitterCredentialsForm
+from .metrics import PIPELINE_REGISTRY
 from .models import NostrCredentials
 from .models import Note
 from .models import TwitterCredentials
+from .tracing import current_trace_context
+from .tracing import span
 from .utils import process_excel_file
 
 EXCEPTION = "You do not have permission to modify/delete this note"
@@ -62,7 +72,10 @@ class TweetCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user  # Asigna el usuario actual al note
-        return super().form_valid(form)
+        with span("note.create", user_id=self.request.user.id):
+            # Publishing continues the trace of this request
+            form.instance.trace_context = current_trace_context()
+            return super().form_valid(form)
 
 
 class TweetUpdateView(LoginRequiredMixin, UserOwnsTweetMixin, UpdateView):
@@ -113,7 +126,8 @@ class TweetBulkUploadView(LoginRequiredMixin, FormView):
             return self.form_invalid(form)
 
         # Process the Excel file
-        result = process_excel_file(excel_file, self.request.user)
+        with span("notes.bulk_upload", user_id=self.request.user.id):
+            result = process_excel_file(excel_file, self.request.user)
 
         if result["success"]:
             messages.success(
@@ -217,3 +231,20 @@ class NostrCredentialsUpdateView(LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         messages.success(self.request, "Nostr credentials updated successfully.")
         return reverse("users:detail", kwargs={"username": self.request.user.username})
+
+
+# No transaction: a scrape does not touch the database
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class MetricsView(View):
+    """Prometheus metrics of the publishing pipeline, read from the cache."""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS_TOKEN:
+            raise Http404
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+            raise PermissionDenied
+        return HttpResponse(
+            generate_latest(PIPELINE_REGISTRY),
+            content_type=CONTENT_TYPE_LATEST,
+        )
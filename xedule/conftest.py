@@ -1,3 +1,6 @@
+from unittest import mock
+
+import fakeredis
 import pytest
 
 from xedule.users.models import User
@@ -9,6 +12,26 @@ def _media_storage(settings, tmpdir) -> None:
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+@pytest.fixture(autouse=True)
+def fake_redis():
+    """In-memory Redis for the locks, since tests run without a server."""
+    client = fakeredis.FakeRedis()
+    with mock.patch("xedule.app.locks.get_redis", return_value=client):
+        yield client
+
+
 @pytest.fixture
 def user(db) -> User:
     return UserFactory()
+
+
+@pytest.fixture
+def tweet_client():
+    """Twitter client whose posts all succeed as tweet 123."""
+    client = mock.Mock()
+    client.create_tweet.return_value = mock.Mock(
+        status_code=201,
+        headers={},
+        json=mock.Mock(return_value={"data": {"id": "123"}}),
+    )
+    return client